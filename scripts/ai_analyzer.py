@@ -5,10 +5,35 @@ import os
 import re
 import logging
 import configparser
+import subprocess
+import shutil
+import mimetypes
+import threading
+import tempfile
+import hashlib
+import argparse
+import time
+import glob
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from http_client import ApiClient
+from job_ledger import JobLedger, ANALYZING, WRITTEN, FAILED
+from pipeline import Pipeline, Stage
+from transcript_cache import TranscriptCache, make_cache_key, atomic_write_bytes
+from media_segments import probe_duration, detect_silences, plan_segments, stitch_segments
+from word_store import WordStore, TIME_SCALE
+from transcript_segments import (build_segments_from_columns, format_segments, format_words_from_columns, word_level_length_from_columns,
+                                 estimate_tokens, format_timecode, parse_timecode, split_into_chunks, APPROX_CHARS_PER_TOKEN)
+
+# Последняя ошибка в текущем потоке — попадает в журнал заданий, когда обработка завершается через sys.exit()
+_last_error = threading.local()
 
 def send_notification(message, level="ERROR"):
     """Функция-заглушка для отправки уведомлений. Пока просто логирует сообщение."""
     if level == "ERROR":
+        _last_error.message = message
         logging.error(f"УВЕДОМЛЕНИЕ: {message}")
     else:
         logging.info(f"УВЕДОМЛЕНИЕ: {message}")
@@ -39,112 +64,398 @@ NVIDIA_API_URL = config.get('NVIDIA_API', 'api_url')
 NVIDIA_MODEL = config.get('NVIDIA_API', 'model')
 OBSIDIAN_VAULT_PATH = os.path.expanduser(config.get('Paths', 'obsidian_vault_path'))
 TRANSCRIPT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", config.get('Paths', 'transcript_cache_directory'))
+
+DEEPGRAM_URL = config.get('Deepgram', 'api_url', fallback='https://api.deepgram.com/v1/listen')
+DEEPGRAM_PARAMS = {
+    'model': config.get('Deepgram', 'model', fallback='nova-2'),
+    'language': config.get('Deepgram', 'language', fallback='ru'),
+    'diarize': str(config.getboolean('Deepgram', 'diarize', fallback=True)).lower(),
+    'punctuate': str(config.getboolean('Deepgram', 'punctuate', fallback=True)).lower(),
+}
+
+DEEPGRAM_CONNECT_TIMEOUT = config.getfloat('Deepgram', 'connect_timeout', fallback=10)
+# Deepgram отвечает только после распознавания всего файла, поэтому таймаут чтения большой
+DEEPGRAM_READ_TIMEOUT = config.getfloat('Deepgram', 'read_timeout', fallback=900)
+DEEPGRAM_REQUESTS_PER_MINUTE = config.getfloat('Deepgram', 'requests_per_minute', fallback=0)
+DEEPGRAM_BURST = config.getint('Deepgram', 'burst', fallback=2)
+
+# Повторы при сетевых ошибках и ответах 408/429/5xx (общие для Deepgram и NVIDIA API)
+HTTP_RETRY_SETTINGS = {
+    'max_retries': config.getint('HTTP', 'max_retries', fallback=5),
+    'backoff_base': config.getfloat('HTTP', 'backoff_base', fallback=1.0),
+    'backoff_max': config.getfloat('HTTP', 'backoff_max', fallback=60.0),
+    'pool_size': config.getint('HTTP', 'pool_size', fallback=10),
+}
+
+TRANSCRIPT_CACHE_MAX_BYTES = int(config.getfloat('Transcript_Cache', 'max_size_mb', fallback=2048) * 1024 * 1024)
+# Рядом с JSON-ответом Deepgram хранится колоночное хранилище слов (.words), которое читается через mmap
+WORD_STORE_ENABLED = config.getboolean('Transcript_Cache', 'word_store', fallback=True)
+WORD_STORE_SUFFIX = ".words"
+
+# Длинные записи режутся по паузам на сегменты, которые транскрибируются параллельно
+SEGMENTED_ENABLED = config.getboolean('Segmented_Transcription', 'enabled', fallback=True)
+SEGMENTED_MIN_DURATION_SECONDS = config.getfloat('Segmented_Transcription', 'min_duration_minutes', fallback=30) * 60
+SEGMENTED_SEGMENT_SECONDS = config.getfloat('Segmented_Transcription', 'segment_minutes', fallback=10) * 60
+SEGMENTED_OVERLAP_SECONDS = config.getfloat('Segmented_Transcription', 'overlap_seconds', fallback=15)
+SEGMENTED_SEARCH_WINDOW_SECONDS = config.getfloat('Segmented_Transcription', 'search_window_seconds', fallback=60)
+SEGMENTED_SILENCE_NOISE_DB = config.getfloat('Segmented_Transcription', 'silence_noise_db', fallback=-35)
+SEGMENTED_SILENCE_MIN_SECONDS = config.getfloat('Segmented_Transcription', 'silence_min_seconds', fallback=0.5)
+SEGMENTED_PARALLELISM = config.getint('Segmented_Transcription', 'parallelism', fallback=3)
+
+TRANSCRIPT_FORMAT = config.get('Transcript', 'format', fallback='segments').strip().lower()
+TRANSCRIPT_MAX_SEGMENT_CHARS = config.getint('Transcript', 'max_segment_chars', fallback=400)
+TRANSCRIPT_PAUSE_SECONDS = config.getfloat('Transcript', 'pause_seconds', fallback=1.5)
+TRANSCRIPT_SPEAKER_LABELS = config.getboolean('Transcript', 'speaker_labels', fallback=True)
+
+# Потоковый режим: ответ LLM читается по мере генерации (SSE) и пишется в заметку инкрементально
+NVIDIA_STREAM = config.getboolean('NVIDIA_API', 'stream', fallback=True)
+NVIDIA_CONNECT_TIMEOUT = config.getfloat('NVIDIA_API', 'connect_timeout', fallback=10)
+NVIDIA_STREAM_IDLE_TIMEOUT = config.getfloat('NVIDIA_API', 'stream_idle_timeout', fallback=120)
+NVIDIA_READ_TIMEOUT = config.getfloat('NVIDIA_API', 'read_timeout', fallback=300)
+NVIDIA_REQUESTS_PER_MINUTE = config.getfloat('NVIDIA_API', 'requests_per_minute', fallback=40)
+NVIDIA_BURST = config.getint('NVIDIA_API', 'burst', fallback=4)
+# Временные файлы заметок, не менявшиеся дольше этого срока, считаются брошенными (процесс был убит) и удаляются при запуске
+NOTE_PART_STALE_SECONDS = config.getfloat('NVIDIA_API', 'stale_part_hours', fallback=6) * 3600
+NOTE_PART_SUFFIX = ".md.part"
+
+NVIDIA_SAMPLING_PARAMS = {
+    "temperature": 0.3,
+    "top_p": 0.7,
+    "max_tokens": 8192,
+}
+
+# Кэш результатов анализа LLM: повторный запуск на том же транскрипте не оплачивает новый запрос
+ANALYSIS_CACHE_ENABLED = config.getboolean('Analysis_Cache', 'enabled', fallback=True)
+ANALYSIS_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", config.get('Analysis_Cache', 'directory', fallback='.analysis_cache'))
+ANALYSIS_CACHE_MAX_BYTES = int(config.getfloat('Analysis_Cache', 'max_size_mb', fallback=256) * 1024 * 1024)
+ANALYSIS_CACHE_TTL_SECONDS = config.getfloat('Analysis_Cache', 'ttl_days', fallback=30) * 86400
+
+# Транскрипты длиннее порога анализируются по перекрывающимся фрагментам (map) с последующим объединением (reduce)
+LLM_MAP_REDUCE_THRESHOLD_TOKENS = config.getint('LLM_Analysis', 'map_reduce_threshold_tokens', fallback=24000)
+LLM_CHUNK_CHARS = int(config.getint('LLM_Analysis', 'chunk_tokens', fallback=6000) * APPROX_CHARS_PER_TOKEN)
+LLM_CHUNK_OVERLAP_CHARS = int(config.getint('LLM_Analysis', 'chunk_overlap_tokens', fallback=400) * APPROX_CHARS_PER_TOKEN)
+LLM_MAP_PARALLELISM = config.getint('LLM_Analysis', 'map_parallelism', fallback=4)
+# Попыток на один фрагмент map-шага: повтор при сбое запроса или ответе без JSON, затем фрагмент пропускается
+LLM_MAP_CHUNK_ATTEMPTS = 2
+LLM_MAP_EXAMPLES_PER_CHUNK = config.getint('LLM_Analysis', 'examples_per_chunk', fallback=5)
+LLM_REDUCE_MAX_EXAMPLES = config.getint('LLM_Analysis', 'reduce_max_examples', fallback=10)
+LLM_DEDUPE_WINDOW_SECONDS = config.getint('LLM_Analysis', 'dedupe_window_seconds', fallback=60)
+
+AUDIO_EXTRACTION_ENABLED = config.getboolean('Audio_Extraction', 'enabled', fallback=True)
+AUDIO_CODEC = config.get('Audio_Extraction', 'codec', fallback='opus').strip().lower()
+AUDIO_BITRATE = config.get('Audio_Extraction', 'bitrate', fallback='32k').strip()
+AUDIO_SAMPLE_RATE = config.getint('Audio_Extraction', 'sample_rate', fallback=16000)
+AUDIO_CHANNELS = config.getint('Audio_Extraction', 'channels', fallback=1)
 # ---------------------
 
+# Поддерживаемые форматы извлечения аудио: кодек ffmpeg, контейнер и MIME-тип для Deepgram
+AUDIO_FORMATS = {
+    'opus': {'encoder': 'libopus', 'container': 'ogg', 'mime': 'audio/ogg', 'lossy': True},
+    'mp3': {'encoder': 'libmp3lame', 'container': 'mp3', 'mime': 'audio/mpeg', 'lossy': True},
+    'flac': {'encoder': 'flac', 'container': 'flac', 'mime': 'audio/flac', 'lossy': False},
+    'wav': {'encoder': 'pcm_s16le', 'container': 'wav', 'mime': 'audio/wav', 'lossy': False},
+}
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Сколько последних строк stderr ffmpeg хранить для сообщения об ошибке
+FFMPEG_STDERR_TAIL_LINES = 50
+
+# Метрики заданий: по строке JSON на каждый обработанный файл (длительности этапов, байты, токены, кэши, повторы)
+METRICS_ENABLED = config.getboolean('Metrics', 'enabled', fallback=True)
+METRICS_JSONL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", config.get('Metrics', 'jsonl_path', fallback='metrics.jsonl'))
+metrics.configure(METRICS_JSONL_PATH if METRICS_ENABLED else None)
+
+# Журнал заданий (SQLite): состояние каждого файла переживает перезапуск, исходник удаляется только после подтвержденной записи
+LEDGER_ENABLED = config.getboolean('Ledger', 'enabled', fallback=True)
+LEDGER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", config.get('Ledger', 'path', fallback='.job_ledger.sqlite'))
+LEDGER_MAX_ATTEMPTS = config.getint('Ledger', 'max_attempts', fallback=3)
+
+# Конвейер для нескольких файлов (--batch, --resume, несколько путей): число исполнителей каждого этапа
+# и размер очереди перед этапом, которая ограничивает число файлов в работе
+PIPELINE_PREPARE_WORKERS = config.getint('Pipeline', 'prepare_workers', fallback=2)
+PIPELINE_TRANSCRIBE_WORKERS = config.getint('Pipeline', 'transcribe_workers', fallback=2)
+PIPELINE_ANALYZE_WORKERS = config.getint('Pipeline', 'analyze_workers', fallback=2)
+PIPELINE_WRITE_WORKERS = config.getint('Pipeline', 'write_workers', fallback=1)
+PIPELINE_QUEUE_SIZE = config.getint('Pipeline', 'queue_size', fallback=4)
+
+_transcript_cache = None
+_deepgram_client = None
+_nvidia_client = None
+_http_clients_lock = threading.Lock()
+_analysis_cache = None
+_analysis_cache_lock = threading.Lock()
+_analysis_cache_stats = {'hits': 0, 'misses': 0}
+_analysis_cache_stats_lock = threading.Lock()
+_job_ledger = None
+_job_ledger_lock = threading.Lock()
+_transcript_cache_lock = threading.Lock()
+
+def format_size(num_bytes):
+    """Форматирует размер в байтах в удобочитаемый вид."""
+    size = float(num_bytes)
+    for unit in ('Б', 'КБ', 'МБ', 'ГБ'):
+        if size < 1024 or unit == 'ГБ':
+            return f"{size:.1f} {unit}"
+        size /= 1024
+
+def guess_media_mime_type(path):
+    """Определяет MIME-тип исходного медиафайла для загрузки без извлечения аудио."""
+    mime_type, _ = mimetypes.guess_type(path)
+    return mime_type or "application/octet-stream"
+
+def build_ffmpeg_command(input_path, codec=None, start=None, duration=None):
+    """Собирает команду ffmpeg, которая пишет сжатую аудиодорожку (или ее фрагмент) в stdout."""
+    codec = codec or AUDIO_CODEC
+    audio_format = AUDIO_FORMATS[codec]
+    command = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin"]
+    if start:
+        command += ["-ss", f"{start:.3f}"]
+    if duration:
+        command += ["-t", f"{duration:.3f}"]
+    command += [
+        "-i", input_path,
+        "-vn", "-sn", "-dn",
+        "-ac", str(AUDIO_CHANNELS),
+        "-ar", str(AUDIO_SAMPLE_RATE),
+        "-c:a", audio_format['encoder'],
+    ]
+    if audio_format['lossy'] and AUDIO_BITRATE:
+        command += ["-b:a", AUDIO_BITRATE]
+    command += ["-f", audio_format['container'], "pipe:1"]
+    return command
+
+class AudioExtractionStream:
+    """Потоковое извлечение аудио через ffmpeg: данные идут из stdout прямо в HTTP-запрос без временного файла."""
+
+    def __init__(self, input_path, codec=None, start=None, duration=None):
+        self.input_path = input_path
+        self.start = start
+        self.duration = duration
+        self.codec = codec or AUDIO_CODEC
+        self.mime_type = AUDIO_FORMATS[self.codec]['mime']
+        self.bytes_sent = 0
+        self.finished_at = None
+        self.process = None
+        self._stderr_tail = deque(maxlen=FFMPEG_STDERR_TAIL_LINES)
+        self._stderr_reader = None
+
+    def _read_stderr(self, stream, tail):
+        # stderr читается параллельно с stdout: иначе ffmpeg, заполнив буфер канала сообщениями об ошибках,
+        # блокируется на записи, stdout не доходит до EOF и загрузка зависает
+        with stream:
+            for line in stream:
+                tail.append(line.decode('utf-8', errors='replace').rstrip())
+
+    def __iter__(self):
+        # При повторной попытке загрузки ffmpeg запускается заново
+        self.abort()
+        self.bytes_sent = 0
+        self.finished_at = None
+        self.process = subprocess.Popen(build_ffmpeg_command(self.input_path, self.codec, self.start, self.duration),
+                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self._stderr_tail = deque(maxlen=FFMPEG_STDERR_TAIL_LINES)
+        self._stderr_reader = threading.Thread(target=self._read_stderr, args=(self.process.stderr, self._stderr_tail),
+                                               name="ffmpeg-stderr", daemon=True)
+        self._stderr_reader.start()
+        try:
+            while True:
+                chunk = self.process.stdout.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                self.bytes_sent += len(chunk)
+                yield chunk
+            self.finished_at = time.monotonic()
+        finally:
+            self.process.stdout.close()
+
+    def finish(self):
+        """Дожидается завершения ffmpeg и проверяет код возврата."""
+        if self.process is None:
+            return
+        return_code = self.process.wait()
+        self._stderr_reader.join()
+        if return_code != 0:
+            stderr_output = "\n".join(line for line in self._stderr_tail if line)
+            raise RuntimeError(f"ffmpeg завершился с кодом {return_code}: {stderr_output}")
+
+    def abort(self):
+        """Останавливает ffmpeg, если загрузка прервалась."""
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+class FileUploadStream:
+    """Потоковая загрузка исходного файла целиком с подсчетом отправленных байт."""
+
+    def __init__(self, input_path):
+        self.input_path = input_path
+        self.mime_type = guess_media_mime_type(input_path)
+        self.bytes_sent = 0
+        self.finished_at = None
+
+    def __iter__(self):
+        self.bytes_sent = 0
+        self.finished_at = None
+        with open(self.input_path, 'rb') as media_file:
+            while True:
+                chunk = media_file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                self.bytes_sent += len(chunk)
+                yield chunk
+        self.finished_at = time.monotonic()
+
+    def finish(self):
+        pass
+
+    def abort(self):
+        pass
+
+def open_upload_stream(input_path):
+    """Выбирает источник данных для загрузки: извлеченное ffmpeg аудио или исходный файл."""
+    if not AUDIO_EXTRACTION_ENABLED:
+        return FileUploadStream(input_path)
+    if AUDIO_CODEC not in AUDIO_FORMATS:
+        logging.warning(f"Неизвестный кодек извлечения аудио '{AUDIO_CODEC}' (поддерживаются: {', '.join(AUDIO_FORMATS)}). Загружаем исходный файл.")
+        return FileUploadStream(input_path)
+    if shutil.which("ffmpeg") is None:
+        logging.warning("ffmpeg не найден в PATH. Загружаем исходный файл без извлечения аудио.")
+        return FileUploadStream(input_path)
+    return AudioExtractionStream(input_path)
+
+def get_deepgram_client():
+    """Общий HTTP-клиент Deepgram: один пул соединений и один ограничитель частоты на процесс."""
+    global _deepgram_client
+    with _http_clients_lock:
+        if _deepgram_client is None:
+            _deepgram_client = ApiClient("Deepgram", rate_per_minute=DEEPGRAM_REQUESTS_PER_MINUTE, burst=DEEPGRAM_BURST,
+                                         connect_timeout=DEEPGRAM_CONNECT_TIMEOUT, read_timeout=DEEPGRAM_READ_TIMEOUT,
+                                         **HTTP_RETRY_SETTINGS)
+    return _deepgram_client
+
+def get_nvidia_client():
+    """Общий HTTP-клиент NVIDIA API: один пул соединений и один ограничитель частоты на процесс."""
+    global _nvidia_client
+    with _http_clients_lock:
+        if _nvidia_client is None:
+            _nvidia_client = ApiClient("NVIDIA API", rate_per_minute=NVIDIA_REQUESTS_PER_MINUTE, burst=NVIDIA_BURST,
+                                       connect_timeout=NVIDIA_CONNECT_TIMEOUT, read_timeout=NVIDIA_READ_TIMEOUT,
+                                       **HTTP_RETRY_SETTINGS)
+    return _nvidia_client
+
+def get_analysis_cache():
+    """Возвращает общий экземпляр кэша результатов анализа LLM."""
+    global _analysis_cache
+    with _analysis_cache_lock:
+        if _analysis_cache is None:
+            _analysis_cache = TranscriptCache(ANALYSIS_CACHE_DIR, ANALYSIS_CACHE_MAX_BYTES, ANALYSIS_CACHE_TTL_SECONDS,
+                                              name="Кэш анализа")
+    return _analysis_cache
+
+def get_transcript_cache():
+    """Возвращает общий экземпляр кэша транскриптов (создается при первом обращении)."""
+    global _transcript_cache
+    with _transcript_cache_lock:
+        if _transcript_cache is None:
+            _transcript_cache = TranscriptCache(TRANSCRIPT_CACHE_DIR, TRANSCRIPT_CACHE_MAX_BYTES)
+    return _transcript_cache
+
+def get_job_ledger():
+    """Возвращает общий журнал заданий или None, если он отключен в [Ledger]."""
+    global _job_ledger
+    if not LEDGER_ENABLED:
+        return None
+    with _job_ledger_lock:
+        if _job_ledger is None:
+            _job_ledger = JobLedger(LEDGER_PATH)
+    return _job_ledger
+
+def format_timecoded_transcript(store):
+    """Собирает транскрипт с тайм-кодами из хранилища слов (по сегментам или по словам, см. [Transcript])."""
+    if TRANSCRIPT_FORMAT == 'words':
+        transcript = format_words_from_columns(store.vocab, store.word_ids, store.starts, scale=TIME_SCALE)
+        segment_count = len(store)
+    else:
+        segments = build_segments_from_columns(store.vocab, store.word_ids, store.starts, store.ends, store.speakers,
+                                               max_chars=TRANSCRIPT_MAX_SEGMENT_CHARS, pause_seconds=TRANSCRIPT_PAUSE_SECONDS,
+                                               scale=TIME_SCALE)
+        transcript = format_segments(segments, speaker_labels=TRANSCRIPT_SPEAKER_LABELS)
+        segment_count = len(segments)
+    word_level_chars = word_level_length_from_columns(store.vocab, store.word_ids)
+    ratio = f", {len(transcript) / word_level_chars:.0%} от пословного формата" if word_level_chars else ""
+    logging.info(f"Транскрипт: {len(store)} слов, {segment_count} сегментов, {len(transcript)} символов "
+                 f"(~{estimate_tokens(len(transcript))} токенов) вместо {word_level_chars} символов "
+                 f"(~{estimate_tokens(word_level_chars)} токенов){ratio}")
+    return transcript
+
+def save_word_store(cache, cache_key, store):
+    """Сохраняет хранилище слов рядом с JSON-записью кэша (если включено [Transcript_Cache] word_store)."""
+    if WORD_STORE_ENABLED:
+        cache.put_sidecar(cache_key, WORD_STORE_SUFFIX, store.to_bytes())
+
+def load_cached_words(cache, cache_key):
+    """Загружает слова из кэша транскриптов или возвращает None.
+
+    Сначала читается колоночное хранилище (.words) через mmap. Если его нет (кэш прежних версий)
+    или оно повреждено, разбирается JSON-ответ Deepgram и хранилище создается для следующих обращений.
+    """
+    if WORD_STORE_ENABLED:
+        store_path = cache.get_sidecar_path(cache_key, WORD_STORE_SUFFIX)
+        if store_path is not None:
+            try:
+                with metrics.stage('transcript_load'):
+                    return WordStore.load(store_path)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Хранилище слов {store_path} повреждено: {e}. Читаем JSON-ответ Deepgram.")
+                cache.remove_sidecar(cache_key, WORD_STORE_SUFFIX)
+    with metrics.stage('transcript_load'):
+        data = cache.get(cache_key)
+        if data is None:
+            return None
+        store = WordStore.from_deepgram(data)
+    if WORD_STORE_ENABLED:
+        save_word_store(cache, cache_key, store)
+        logging.info(f"Кэш транскрипта {cache_key} дополнен хранилищем слов: {cache.entry_path(cache_key, WORD_STORE_SUFFIX)}")
+    return store
+
 def transcribe_with_deepgram(video_path):
     """Транскрибирует видеофайл с помощью Deepgram API, используя кэширование."""
+    with metrics.stage('transcribe'):
+        return _transcribe_with_deepgram(video_path)
+
+def _transcribe_with_deepgram(video_path):
     if not DEEPGRAM_API_KEY:
         error_message = f"Ошибка: DEEPGRAM_API_KEY не установлен. Пожалуйста, создайте файл {DEEPGRAM_API_KEY_FILE} и поместите в него ваш ключ."
         logging.error(error_message)
         send_notification(error_message)
         sys.exit(1)
 
-    # Создаем директорию для кэша, если ее нет
-    os.makedirs(TRANSCRIPT_CACHE_DIR, exist_ok=True)
-
-    # Генерируем имя кэш-файла на основе имени видеофайла
     video_filename = os.path.basename(video_path)
-    json_cache_filename = os.path.join(TRANSCRIPT_CACHE_DIR, f"{video_filename}.json")
-    text_cache_filename = os.path.join(TRANSCRIPT_CACHE_DIR, f"{video_filename}.txt")
-
-    # Проверяем, существует ли кэшированный текстовый транскрипт
-    if os.path.exists(text_cache_filename):
-        logging.info(f"Используем кэшированный текстовый транскрипт для {video_filename}")
-        with open(text_cache_filename, 'r', encoding='utf-8') as f:
-            return f.read()
-
-    # Проверяем, существует ли кэшированный JSON-транскрипт
-    if os.path.exists(json_cache_filename):
-        logging.info(f"Используем кэшированный JSON-транскрипт для {video_filename}")
-        try:
-            with open(json_cache_filename, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            # Извлечение полного текста из JSON для сохранения в текстовый кэш
-            full_text_from_json = []
-            if 'results' in data and 'channels' in data['results'] and data['results']['channels']:
-                for channel in data['results']['channels']:
-                    for alternative in channel['alternatives']:
-                        full_text_from_json.append(alternative['transcript'])
-            plain_text_transcript = " ".join(full_text_from_json).strip()
-
-            # Сохраняем чистый текстовый транскрипт в кэш-файл
-            with open(text_cache_filename, 'w', encoding='utf-8') as f:
-                f.write(plain_text_transcript)
-            logging.info(f"Чистый текстовый транскрипт сохранен в кэш: {text_cache_filename}")
-
-            # Извлечение транскрипта с тайм-кодами для возврата
-            full_text_with_timecodes = []
-            if 'results' in data and 'channels' in data['results'] and data['results']['channels']:
-                for channel in data['results']['channels']:
-                    for alternative in channel['alternatives']:
-                        for word_info in alternative['words']:
-                            start_time = str(int(word_info['start'] // 3600)).zfill(2) + ':' + \
-                                         str(int((word_info['start'] % 3600) // 60)).zfill(2) + ':' + \
-                                         str(int(word_info['start'] % 60)).zfill(2)
-                            full_text_with_timecodes.append(f"[{start_time}] {word_info['word'].strip()}")
-            return " ".join(full_text_with_timecodes)
-        except Exception as e:
-            logging.error(f"Ошибка при чтении кэш-файла {json_cache_filename}: {e}. Повторяем транскрипцию.")
-            # Если кэш-файл поврежден, удаляем его и продолжаем без него
-            os.remove(json_cache_filename)
-
-    logging.info(f"Кэшированный транскрипт для {video_filename} не найден или поврежден. Выполняем транскрипцию с Deepgram API...")
+    cache = get_transcript_cache()
+    with metrics.stage('content_hash'):
+        cache_key = make_cache_key(cache.content_hash(video_path), DEEPGRAM_PARAMS)
 
-    # URL для Deepgram API
-    DEEPGRAM_URL = "https://api.deepgram.com/v1/listen?punctuate=true&diarize=true&language=ru&model=nova-2"
+    store = load_cached_words(cache, cache_key)
+    metrics.cache_result('transcript', store is not None)
+    if store is not None:
+        logging.info(f"Используем кэшированный транскрипт Deepgram для {video_filename} (ключ {cache_key})")
+        return format_timecoded_transcript(store)
 
-    headers = {
-        "Authorization": f"Token {DEEPGRAM_API_KEY}",
-        "Content-Type": "video/mp4" # Или другой соответствующий MIME-тип видео
-    }
+    logging.info(f"Кэшированный транскрипт для {video_filename} не найден. Выполняем транскрипцию с Deepgram API...")
 
     try:
-        with open(video_path, 'rb') as video_file:
-            response = requests.post(DEEPGRAM_URL, headers=headers, data=video_file)
-            response.raise_for_status() # Вызывает исключение для ошибок HTTP
-
-        data = response.json()
-        
-        # Сохраняем полный ответ Deepgram в кэш-файл
-        with open(json_cache_filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
-        logging.info(f"Полный JSON-транскрипт Deepgram сохранен в кэш: {json_cache_filename}")
-
-        # Извлечение чистого текста транскрипции для сохранения в текстовый кэш
-        plain_text_transcript = ""
-        if 'results' in data and 'channels' in data['results'] and data['results']['channels']:
-            for channel in data['results']['channels']:
-                for alternative in channel['alternatives']:
-                    plain_text_transcript += alternative['transcript'] + " "
-        plain_text_transcript = plain_text_transcript.strip()
-
-        # Сохраняем чистый текстовый транскрипт в кэш-файл
-        with open(text_cache_filename, 'w', encoding='utf-8') as f:
-            f.write(plain_text_transcript)
-        logging.info(f"Чистый текстовый транскрипт сохранен в кэш: {text_cache_filename}")
-
-        # Извлечение транскрипта с тайм-кодами для возврата
-        full_text_with_timecodes = []
-        if 'results' in data and 'channels' in data['results'] and data['results']['channels']:
-            for channel in data['results']['channels']:
-                for alternative in channel['alternatives']:
-                    for word_info in alternative['words']:
-                        start_time = str(int(word_info['start'] // 3600)).zfill(2) + ':' + \
-                                     str(int((word_info['start'] % 3600) // 60)).zfill(2) + ':' + \
-                                     str(int(word_info['start'] % 60)).zfill(2)
-                        full_text_with_timecodes.append(f"[{start_time}] {word_info['word'].strip()}")
-        
-        return " ".join(full_text_with_timecodes)
+        if should_transcribe_in_segments(video_path):
+            data = transcribe_in_segments(video_path, cache_key)
+        else:
+            data = upload_to_deepgram(open_upload_stream(video_path), video_filename, os.path.getsize(video_path))
+
+        # Сохраняем полный ответ Deepgram в кэш
+        cache.put(cache_key, data, source_name=video_filename)
+        logging.info(f"Ответ Deepgram сохранен в кэш: {cache.entry_path(cache_key)}")
+        store = WordStore.from_deepgram(data)
+        save_word_store(cache, cache_key, store)
+
+        return format_timecoded_transcript(store)
     except requests.exceptions.RequestException as e:
         error_message = f"Ошибка при обращении к Deepgram API: {e}"
         logging.error(error_message)
@@ -156,25 +467,98 @@ def transcribe_with_deepgram(video_path):
         send_notification(error_message)
         sys.exit(1)
 
-def analyze_with_nvidia_llm(transcript):
-    """Отправляет транскрипт в NVIDIA API и получает структурированный Markdown."""
-    if not NVIDIA_API_KEY:
-        error_message = f"Ошибка: NVIDIA_API_KEY не установлен. Пожалуйста, создайте файл {NVIDIA_API_KEY_FILE} и поместите в него ваш ключ."
-        logging.error(error_message)
-        send_notification(error_message)
-        sys.exit(1)
-    prompt = f"""Ты — ИИ-аналитик, помогающий исследователю из Общества Сторожевой Башни. 
-    Твоя задача — проанализировать предоставленную стенограмму лекции на русском языке, чтобы найти ключевые "наглядные пособия" или "примеры" и объяснения библейских стихов для дальнейшего исследования.
-    **Крайне важно:**
-    1. Отвечай **ТОЛЬКО НА РУССКОМ ЯЗЫКЕ**.
-    2. Используй только информацию из предоставленного транскрипта. Не генерируй информацию извне и не галлюцинируй.
+def upload_to_deepgram(upload_stream, label, source_size):
+    """Отправляет поток (аудио или исходный файл) в Deepgram и возвращает JSON-ответ."""
+    headers = {
+        "Authorization": f"Token {DEEPGRAM_API_KEY}",
+        "Content-Type": upload_stream.mime_type
+    }
+    logging.info(f"Загрузка в Deepgram: {label} ({format_size(source_size)}), Content-Type: {upload_stream.mime_type}")
+    started = time.monotonic()
+    try:
+        response = get_deepgram_client().post(DEEPGRAM_URL, params=DEEPGRAM_PARAMS, headers=headers, data=upload_stream)
+        upload_stream.finish()
+    except BaseException:
+        upload_stream.abort()
+        raise
+    responded = time.monotonic()
+    response.raise_for_status() # Вызывает исключение для ошибок HTTP
 
-    Выполни 3 шага:
-    1. **Заголовок:** Сгенерируй краткий и точный заголовок (не более 10 слов) из транскрипта. Заголовок должен быть без квадратных скобок.
-    2. **Примеры:** Выдели **3-5** наиболее ярких наглядных примеров (иллюстраций) и объяснений библейских стихов, которые использовал спикер. Укажи **тайм-код** (в формате HH:MM:SS) начала каждого примера из транскрипта.
-    3. **Формат:** Отформатируй ВСЕ в формат Obsidian Markdown, используя YAML Frontmatter и Callouts. Добавь к каждому примеру **понятные теги**, которые помогут легко найти его в Obsidian (например, #БиблейскийПример, #НаглядноеПособие, #ОбъяснениеСтиха). **Не включай ничего, кроме запрошенного Markdown**.
+    bytes_sent = upload_stream.bytes_sent
+    # Загрузка — до отправки последнего байта (включая повторы), обработка — ожидание ответа после нее
+    upload_finished = upload_stream.finished_at or responded
+    metrics.add_stage('deepgram_upload', upload_finished - started)
+    metrics.add_stage('deepgram_processing', responded - upload_finished)
+    metrics.add('deepgram_requests')
+    metrics.add('deepgram_bytes_sent', bytes_sent)
+    metrics.add('deepgram_bytes_received', len(response.content))
+    if source_size:
+        logging.info(f"{label}: отправлено {format_size(bytes_sent)} вместо {format_size(source_size)} "
+                     f"({bytes_sent} / {source_size} байт, {bytes_sent / source_size:.1%} от исходного размера)")
+    else:
+        logging.info(f"{label}: отправлено {bytes_sent} байт")
+    return response.json()
 
-    ---
+def should_transcribe_in_segments(video_path):
+    """Длинные записи (не короче [Segmented_Transcription] min_duration_minutes) транскрибируются по сегментам."""
+    if not SEGMENTED_ENABLED or not AUDIO_EXTRACTION_ENABLED or AUDIO_CODEC not in AUDIO_FORMATS:
+        return False
+    if shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None:
+        return False
+    try:
+        duration = probe_duration(video_path)
+    except (subprocess.CalledProcessError, ValueError) as e:
+        logging.warning(f"Не удалось определить длительность {video_path}: {e}. Загружаем файл целиком.")
+        return False
+    return duration >= SEGMENTED_MIN_DURATION_SECONDS
+
+def transcribe_in_segments(video_path, cache_key):
+    """Режет запись по паузам на сегменты, транскрибирует их параллельно и склеивает ответы.
+
+    Ответ каждого сегмента сохраняется как контрольная точка, поэтому после сбоя повторно
+    отправляются только недостающие сегменты. Результат имеет формат обычного ответа Deepgram.
+    """
+    checkpoint_dir = os.path.join(TRANSCRIPT_CACHE_DIR, "segments", cache_key)
+    plan_path = os.path.join(checkpoint_dir, "plan.json")
+    if os.path.exists(plan_path):
+        with open(plan_path, 'r', encoding='utf-8') as f:
+            plan = json.load(f)
+        logging.info(f"Продолжаем транскрипцию по сегментам с контрольной точки: {checkpoint_dir}")
+    else:
+        started = time.monotonic()
+        with metrics.stage('segment_planning'):
+            duration = probe_duration(video_path)
+            silences = detect_silences(video_path, SEGMENTED_SILENCE_NOISE_DB, SEGMENTED_SILENCE_MIN_SECONDS)
+            plan = plan_segments(duration, silences, SEGMENTED_SEGMENT_SECONDS, SEGMENTED_SEARCH_WINDOW_SECONDS)
+        atomic_write_bytes(plan_path, json.dumps(plan).encode('utf-8'))
+        logging.info(f"План сегментов для {os.path.basename(video_path)}: {len(plan)} сегментов, "
+                     f"найдено пауз: {len(silences)}, анализ занял {time.monotonic() - started:.1f} с")
+
+    def transcribe_segment(index):
+        cut, end = plan[index]
+        # Каждый сегмент, кроме первого, начинается с перекрытия для сопоставления спикеров
+        start = max(0.0, cut - SEGMENTED_OVERLAP_SECONDS) if index else 0.0
+        segment_path = os.path.join(checkpoint_dir, f"{index:04d}.json")
+        if os.path.exists(segment_path):
+            with open(segment_path, 'r', encoding='utf-8') as f:
+                return start, cut, json.load(f)
+        label = f"{os.path.basename(video_path)} [сегмент {index + 1}/{len(plan)}, {format_timecode(start)}–{format_timecode(end)}]"
+        stream = AudioExtractionStream(video_path, start=start, duration=end - start)
+        data = upload_to_deepgram(stream, label, 0)
+        atomic_write_bytes(segment_path, json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        return start, cut, data
+
+    missing = sum(1 for index in range(len(plan)) if not os.path.exists(os.path.join(checkpoint_dir, f"{index:04d}.json")))
+    logging.info(f"Транскрипция по сегментам: {len(plan)} сегментов, осталось {missing}, параллельно до {SEGMENTED_PARALLELISM}")
+    with ThreadPoolExecutor(max_workers=max(1, SEGMENTED_PARALLELISM)) as executor:
+        segments = list(executor.map(metrics.bind(transcribe_segment), range(len(plan))))
+
+    data = stitch_segments(segments, SEGMENTED_OVERLAP_SECONDS)
+    shutil.rmtree(checkpoint_dir, ignore_errors=True)
+    return data
+
+# Блок с требуемым форматом заметки, общий для обычного анализа и reduce-шага map-reduce
+OBSIDIAN_FORMAT_BLOCK = f"""    ---
     ### ТРЕБУЕМЫЙ ФОРМАТ OBSIDIAN ###
     ```markdown
     ---
@@ -192,15 +576,77 @@ def analyze_with_nvidia_llm(transcript):
     
     ## Полный Транскрипт
     ```
-    ---
+"""
+
+def build_analysis_prompt(transcript):
+    """Промпт для анализа всего транскрипта одним запросом."""
+    return f"""Ты — ИИ-аналитик, помогающий исследователю из Общества Сторожевой Башни. 
+    Твоя задача — проанализировать предоставленную стенограмму лекции на русском языке, чтобы найти ключевые "наглядные пособия" или "примеры" и объяснения библейских стихов для дальнейшего исследования.
+    **Крайне важно:**
+    1. Отвечай **ТОЛЬКО НА РУССКОМ ЯЗЫКЕ**.
+    2. Используй только информацию из предоставленного транскрипта. Не генерируй информацию извне и не галлюцинируй.
+
+    Выполни 3 шага:
+    1. **Заголовок:** Сгенерируй краткий и точный заголовок (не более 10 слов) из транскрипта. Заголовок должен быть без квадратных скобок.
+    2. **Примеры:** Выдели **3-5** наиболее ярких наглядных примеров (иллюстраций) и объяснений библейских стихов, которые использовал спикер. Укажи **тайм-код** (в формате HH:MM:SS) начала каждого примера из транскрипта.
+    3. **Формат:** Отформатируй ВСЕ в формат Obsidian Markdown, используя YAML Frontmatter и Callouts. Добавь к каждому примеру **понятные теги**, которые помогут легко найти его в Obsidian (например, #БиблейскийПример, #НаглядноеПособие, #ОбъяснениеСтиха). **Не включай ничего, кроме запрошенного Markdown**.
+
+{OBSIDIAN_FORMAT_BLOCK}    ---
     
     ### ТРАНСКРИПТ ДЛЯ АНАЛИЗА:
     {transcript}
     """
-    
+
+def build_map_prompt(chunk, index, total):
+    """Промпт map-шага: поиск примеров в одном фрагменте длинного транскрипта. Ответ — JSON."""
+    return f"""Ты — ИИ-аналитик, помогающий исследователю из Общества Сторожевой Башни.
+    Ниже фрагмент {index} из {total} стенограммы длинной лекции на русском языке. Найди в нем наиболее яркие "наглядные пособия" или "примеры" и объяснения библейских стихов.
+    **Крайне важно:**
+    1. Отвечай **ТОЛЬКО НА РУССКОМ ЯЗЫКЕ**.
+    2. Используй только информацию из предоставленного фрагмента. Не генерируй информацию извне и не галлюцинируй.
+    3. Тайм-код каждого примера (HH:MM:SS) бери **строго из транскрипта** — это тайм-код строки, с которой начинается пример.
+    4. Выдели не более {LLM_MAP_EXAMPLES_PER_CHUNK} примеров. Если примеров нет, верни пустой список.
+
+    Ответь **ТОЛЬКО JSON** без пояснений и без Markdown, в формате:
+    {{"title": "краткий заголовок фрагмента", "examples": [{{"title": "Название примера", "timecode": "HH:MM:SS", "summary": "краткий пересказ", "tags": ["#Тег1", "#Тег2"]}}]}}
+
+    ### ФРАГМЕНТ ТРАНСКРИПТА:
+    {chunk}
+    """
+
+def build_reduce_prompt(chunk_titles, examples):
+    """Промпт reduce-шага: объединение примеров из всех фрагментов в заметку прежнего формата."""
+    candidates = json.dumps(examples, ensure_ascii=False, indent=1)
+    titles = "\n".join(f"- {title}" for title in chunk_titles if title)
+    return f"""Ты — ИИ-аналитик, помогающий исследователю из Общества Сторожевой Башни.
+    Длинная лекция на русском языке была разбита на фрагменты, и в каждом уже найдены примеры. Ниже заголовки фрагментов и список примеров-кандидатов (JSON) с абсолютными тайм-кодами.
+    **Крайне важно:**
+    1. Отвечай **ТОЛЬКО НА РУССКОМ ЯЗЫКЕ**.
+    2. Используй только информацию из списка кандидатов. Не генерируй информацию извне и не галлюцинируй.
+    3. **Не меняй тайм-коды** примеров.
+
+    Выполни 3 шага:
+    1. **Заголовок:** Сгенерируй краткий и точный заголовок всей лекции (не более 10 слов) по заголовкам фрагментов. Заголовок должен быть без квадратных скобок.
+    2. **Примеры:** Объедини повторяющиеся примеры (один и тот же пример мог попасть в соседние фрагменты) и выбери не более {LLM_REDUCE_MAX_EXAMPLES} наиболее ярких, в порядке тайм-кодов.
+    3. **Формат:** Отформатируй ВСЕ в формат Obsidian Markdown, используя YAML Frontmatter и Callouts, сохранив теги примеров. **Не включай ничего, кроме запрошенного Markdown**.
+
+{OBSIDIAN_FORMAT_BLOCK}    ---
+
+    ### ЗАГОЛОВКИ ФРАГМЕНТОВ:
+    {titles}
+
+    ### ПРИМЕРЫ-КАНДИДАТЫ:
+    {candidates}
+    """
+
+def request_nvidia_completion(prompt, sink=None):
+    """Один запрос к NVIDIA API (OpenAI-совместимый chat/completions). Возвращает текст ответа.
+
+    Если передан sink (NoteWriter), текст ответа пишется в него по мере получения.
+    """
     headers = {
         "Authorization": f"Bearer {NVIDIA_API_KEY}",
-        "Accept": "application/json",
+        "Accept": "text/event-stream" if NVIDIA_STREAM else "application/json",
         "Content-Type": "application/json"
     }
     data = {
@@ -208,84 +654,437 @@ def analyze_with_nvidia_llm(transcript):
         "messages": [
             {"role": "user", "content": prompt}
         ],
-        "temperature": 0.3,
-        "top_p": 0.7,
-        "max_tokens": 8192,
-        "stream": False
+        **NVIDIA_SAMPLING_PARAMS,
+        "stream": NVIDIA_STREAM
     }
+    metrics.add('llm_requests')
+    # requests сериализует json= так же (json.dumps с ensure_ascii), поэтому размер совпадает с телом запроса
+    metrics.add('llm_bytes_sent', len(json.dumps(data)))
+    if NVIDIA_STREAM:
+        return stream_nvidia_completion(headers, data, sink)
+    with metrics.stage('llm_request'):
+        response = get_nvidia_client().post(NVIDIA_API_URL, headers=headers, json=data)
+    response.raise_for_status()
+    metrics.add('llm_bytes_received', len(response.content))
+    result = response.json()
+    record_llm_usage(result.get('usage'))
+    content = result.get('choices')[0].get('message').get('content', '')
+    if sink is not None:
+        sink.write(content)
+    return content
 
-    try:
-        response = requests.post(NVIDIA_API_URL, headers=headers, json=data)
+def record_llm_usage(usage):
+    """Добавляет в метрики задания число токенов промпта и ответа из поля usage ответа API."""
+    if not usage:
+        return
+    metrics.add('llm_prompt_tokens', usage.get('prompt_tokens') or 0)
+    metrics.add('llm_completion_tokens', usage.get('completion_tokens') or 0)
+
+def stream_nvidia_completion(headers, data, sink=None):
+    """Читает потоковый (SSE) ответ и пишет текст в sink по мере получения.
+
+    Таймаут чтения requests действует на каждое ожидание данных от сервера,
+    поэтому зависший поток прерывается через stream_idle_timeout секунд тишины.
+    """
+    started = time.monotonic()
+    first_token_at = None
+    chunk_count = 0
+    completion_tokens = None
+    bytes_received = 0
+    parts = []
+    if sink is not None:
+        sink.reset()
+    with get_nvidia_client().post(NVIDIA_API_URL, headers=headers, json=data, stream=True,
+                                  timeout=(NVIDIA_CONNECT_TIMEOUT, NVIDIA_STREAM_IDLE_TIMEOUT)) as response:
         response.raise_for_status()
-        return response.json().get('choices')[0].get('message').get('content', '')
+        for line in response.iter_lines():
+            bytes_received += len(line) + 1
+            if not line.startswith(b"data:"):
+                continue
+            payload = line[len(b"data:"):].strip()
+            if payload == b"[DONE]":
+                break
+            event = json.loads(payload)
+            if event.get('usage'):
+                completion_tokens = event['usage'].get('completion_tokens', completion_tokens)
+                record_llm_usage(event['usage'])
+            for choice in event.get('choices') or []:
+                delta = (choice.get('delta') or {}).get('content')
+                if not delta:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.monotonic()
+                    logging.info(f"Первый токен от NVIDIA API через {first_token_at - started:.2f} с")
+                chunk_count += 1
+                parts.append(delta)
+                if sink is not None:
+                    sink.write(delta)
+    elapsed = time.monotonic() - started
+    metrics.add_stage('llm_request', elapsed)
+    if first_token_at is not None:
+        metrics.add_stage('llm_first_token', first_token_at - started)
+    metrics.add('llm_bytes_received', bytes_received)
+    tokens = completion_tokens or chunk_count
+    generation_time = elapsed - (first_token_at - started) if first_token_at is not None else elapsed
+    speed = f"{tokens / generation_time:.1f} ток/с" if generation_time > 0 else "н/д"
+    logging.info(f"Потоковый ответ получен: {tokens} токенов{'' if completion_tokens else ' (по числу фрагментов)'} "
+                 f"за {elapsed:.1f} с, {speed}, время до первого токена: "
+                 f"{f'{first_token_at - started:.2f} с' if first_token_at is not None else 'н/д'}")
+    return "".join(parts)
+
+def parse_map_response(content):
+    """Разбирает JSON-ответ map-шага, допуская обрамление в ```json ... ```."""
+    match = re.search(r'\{.*\}', content, re.DOTALL)
+    if not match:
+        raise ValueError("в ответе нет JSON-объекта")
+    result = json.loads(match.group(0))
+    examples = []
+    for example in result.get('examples') or []:
+        seconds = parse_timecode(str(example.get('timecode', '')))
+        if seconds is None or not example.get('title'):
+            continue
+        tags = example.get('tags') or []
+        if isinstance(tags, str):
+            tags = tags.split()
+        examples.append({
+            'title': str(example['title']).strip().strip('[]'),
+            'timecode': format_timecode(seconds),
+            'seconds': seconds,
+            'summary': str(example.get('summary', '')).strip(),
+            'tags': ['#' + str(tag).lstrip('#').replace(' ', '') for tag in tags if str(tag).strip('# ')],
+        })
+    return str(result.get('title', '')).strip(), examples
+
+def _example_words(example):
+    return set(re.findall(r'\w{4,}', f"{example['title']} {example['summary']}".lower()))
+
+def deduplicate_examples(examples):
+    """Убирает примеры, найденные дважды в перекрывающихся окнах: близкий тайм-код и похожий текст."""
+    unique = []
+    for example in sorted(examples, key=lambda e: e['seconds']):
+        duplicate = None
+        for kept in reversed(unique):
+            if example['seconds'] - kept['seconds'] > LLM_DEDUPE_WINDOW_SECONDS:
+                break
+            kept_words, example_words = _example_words(kept), _example_words(example)
+            union = kept_words | example_words
+            if not union or len(kept_words & example_words) / len(union) >= 0.3:
+                duplicate = kept
+                break
+        if duplicate is None:
+            unique.append(example)
+        elif len(example['summary']) > len(duplicate['summary']):
+            unique[unique.index(duplicate)] = example
+    return unique
+
+def render_obsidian_note(title, examples):
+    """Собирает заметку прежнего формата без LLM (запасной вариант, если reduce-запрос не удался)."""
+    lines = ["---", f"title: {title}", f"tags: [jw, research, transcript, {NVIDIA_MODEL}]", "---", "",
+             "## Анализ: Ключевые Примеры (Наглядные Пособия)", ""]
+    for example in examples:
+        lines.append(f"> [!example|collapse open] [{example['title']}, {example['timecode']}] {' '.join(example['tags'])}".rstrip())
+        lines.append(f"> {example['summary']}")
+        lines.append("")
+    lines.append("## Полный Транскрипт")
+    return "\n".join(lines)
+
+def analyze_with_map_reduce(transcript, sink=None):
+    """Анализ длинного транскрипта: параллельный map по перекрывающимся окнам и reduce в одну заметку."""
+    chunks = split_into_chunks(transcript, LLM_CHUNK_CHARS, LLM_CHUNK_OVERLAP_CHARS)
+    logging.info(f"Map-reduce анализ: {len(chunks)} фрагментов по ~{LLM_CHUNK_CHARS} символов "
+                 f"(перекрытие {LLM_CHUNK_OVERLAP_CHARS}), параллельно до {LLM_MAP_PARALLELISM} запросов")
+
+    def analyze_chunk(index):
+        # Ошибка одного фрагмента (сбой запроса или ответ без JSON) не должна обесценивать уже оплаченные остальные:
+        # фрагмент повторяется один раз, затем считается пустым
+        for attempt in range(1, LLM_MAP_CHUNK_ATTEMPTS + 1):
+            started = time.monotonic()
+            try:
+                content = request_nvidia_completion(build_map_prompt(chunks[index], index + 1, len(chunks)))
+                chunk_title, examples = parse_map_response(content)
+            except Exception as e:
+                logging.warning(f"Фрагмент {index + 1}/{len(chunks)}: попытка {attempt}/{LLM_MAP_CHUNK_ATTEMPTS} не удалась: {e}")
+                continue
+            logging.info(f"Фрагмент {index + 1}/{len(chunks)}: найдено примеров: {len(examples)} за {time.monotonic() - started:.1f} с")
+            return chunk_title, examples
+        return None
+
+    with ThreadPoolExecutor(max_workers=max(1, LLM_MAP_PARALLELISM)) as executor:
+        results = list(executor.map(metrics.bind(analyze_chunk), range(len(chunks))))
+
+    failed_chunks = [index + 1 for index, result in enumerate(results) if result is None]
+    if len(failed_chunks) == len(chunks):
+        raise ValueError(f"ни один из {len(chunks)} фрагментов не удалось проанализировать")
+    if failed_chunks:
+        logging.warning(f"Фрагменты {', '.join(map(str, failed_chunks))} из {len(chunks)} пропущены после ошибок; "
+                        f"заметка собирается из остальных (--force-refresh повторит анализ целиком)")
+    results = [result for result in results if result is not None]
+    chunk_titles = [chunk_title for chunk_title, _ in results]
+    candidates = [example for _, examples in results for example in examples]
+    examples = deduplicate_examples(candidates)
+    logging.info(f"Reduce: {len(candidates)} примеров-кандидатов, после удаления дубликатов: {len(examples)}")
+    if not examples:
+        raise ValueError("ни в одном фрагменте не найдено примеров")
+
+    reduce_input = [{key: example[key] for key in ('title', 'timecode', 'summary', 'tags')} for example in examples]
+    try:
+        return request_nvidia_completion(build_reduce_prompt(chunk_titles, reduce_input), sink=sink)
+    except Exception as e:
+        logging.warning(f"Reduce-запрос к NVIDIA API не удался ({e}). Собираем заметку без LLM.")
+        title = next((chunk_title for chunk_title in chunk_titles if chunk_title), "Анализ лекции")
+        return render_obsidian_note(title, examples[:LLM_REDUCE_MAX_EXAMPLES])
+
+def analysis_cache_key(transcript):
+    """Ключ кэша анализа: хэш транскрипта, шаблонов промптов, модели, параметров генерации и режима map-reduce."""
+    prompt_templates = "\x00".join([
+        build_analysis_prompt("{transcript}"),
+        build_map_prompt("{chunk}", 0, 0),
+        build_reduce_prompt([], []),
+    ])
+    params = {
+        'model': NVIDIA_MODEL,
+        'sampling': NVIDIA_SAMPLING_PARAMS,
+        'prompt': hashlib.blake2b(prompt_templates.encode('utf-8'), digest_size=20).hexdigest(),
+        'map_reduce': [LLM_MAP_REDUCE_THRESHOLD_TOKENS, LLM_CHUNK_CHARS, LLM_CHUNK_OVERLAP_CHARS,
+                       LLM_MAP_EXAMPLES_PER_CHUNK, LLM_REDUCE_MAX_EXAMPLES, LLM_DEDUPE_WINDOW_SECONDS],
+    }
+    transcript_hash = hashlib.blake2b(transcript.encode('utf-8'), digest_size=20).hexdigest()
+    return make_cache_key(transcript_hash, params)
+
+def _count_analysis_cache(result):
+    with _analysis_cache_stats_lock:
+        _analysis_cache_stats[result] += 1
+        return dict(_analysis_cache_stats)
+
+def analyze_with_nvidia_llm(transcript, sink=None, force_refresh=False):
+    """Отправляет транскрипт в NVIDIA API и получает структурированный Markdown.
+
+    Результат берется из кэша анализа, если тот же транскрипт уже анализировался с теми же
+    промптами, моделью и параметрами (force_refresh=True — всегда выполнять запрос).
+    Транскрипты длиннее [LLM_Analysis] map_reduce_threshold_tokens анализируются по частям (map-reduce).
+    В потоковом режиме ответ пишется в sink (NoteWriter) по мере генерации.
+    """
+    with metrics.stage('analyze'):
+        return _analyze_with_nvidia_llm(transcript, sink, force_refresh)
+
+def _analyze_with_nvidia_llm(transcript, sink, force_refresh):
+    cache_key = None
+    if ANALYSIS_CACHE_ENABLED:
+        cache_key = analysis_cache_key(transcript)
+        cached = None if force_refresh else get_analysis_cache().get(cache_key)
+        metrics.cache_result('analysis', cached is not None)
+        if cached is not None:
+            stats = _count_analysis_cache('hits')
+            logging.info(f"Кэш анализа: попадание (ключ {cache_key}). Всего попаданий: {stats['hits']}, промахов: {stats['misses']}")
+            return cached['markdown']
+        stats = _count_analysis_cache('misses')
+        logging.info(f"Кэш анализа: {'принудительное обновление' if force_refresh else 'промах'} (ключ {cache_key}). "
+                     f"Всего попаданий: {stats['hits']}, промахов: {stats['misses']}")
+
+    markdown_output = _request_analysis(transcript, sink)
+    if cache_key is not None and not markdown_output.startswith("Error"):
+        get_analysis_cache().put(cache_key, {'markdown': markdown_output, 'model': NVIDIA_MODEL}, source_name=f"{len(transcript)} символов")
+    return markdown_output
+
+def _request_analysis(transcript, sink):
+    if not NVIDIA_API_KEY:
+        error_message = f"Ошибка: NVIDIA_API_KEY не установлен. Пожалуйста, создайте файл {NVIDIA_API_KEY_FILE} и поместите в него ваш ключ."
+        logging.error(error_message)
+        send_notification(error_message)
+        sys.exit(1)
+
+    transcript_tokens = estimate_tokens(len(transcript))
+    if LLM_MAP_REDUCE_THRESHOLD_TOKENS > 0 and transcript_tokens > LLM_MAP_REDUCE_THRESHOLD_TOKENS:
+        logging.info(f"Транскрипт (~{transcript_tokens} токенов) длиннее порога {LLM_MAP_REDUCE_THRESHOLD_TOKENS}. Используем map-reduce.")
+        try:
+            return analyze_with_map_reduce(transcript, sink=sink)
+        except Exception as e:
+            error_message = f"Ошибка при map-reduce анализе через NVIDIA API: {e}"
+            logging.error(error_message)
+            send_notification(error_message)
+            return f"Error communicating with NVIDIA API: {e}"
+
+    prompt = build_analysis_prompt(transcript)
+    logging.info(f"Размер промпта: {len(prompt)} символов (~{estimate_tokens(len(prompt))} токенов), "
+                 f"из них транскрипт: {len(transcript)} символов")
+
+    try:
+        return request_nvidia_completion(prompt, sink=sink)
     except Exception as e:
         error_message = f"Ошибка при обращении к NVIDIA API: {e}"
         logging.error(error_message)
         send_notification(error_message)
         return f"Error communicating with NVIDIA API: {e}"
 
-def main():
-    logging.basicConfig(level=logging.INFO,
-                        format='%(asctime)s - %(levelname)s - %(message)s',
-                        handlers=[
-                            logging.FileHandler("ai_analyzer.log"),
-                            logging.StreamHandler(sys.stderr)
-                        ])
-    logging.info("Запуск скрипта ai_analyzer.py")
-    if len(sys.argv) < 2:
-        print("Usage: python ai_analyzer.py <path_to_video_or_transcript_file>")
-        sys.exit(1)
+class NoteWriter:
+    """Пишет заметку во временный скрытый файл в хранилище и атомарно переименовывает его по завершении."""
+
+    def __init__(self, directory):
+        fd, self.tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=NOTE_PART_SUFFIX)
+        self._file = os.fdopen(fd, 'w', encoding='utf-8')
+        self._parts = []
+        self.committed = False
+
+    def write(self, text):
+        self._parts.append(text)
+        self._file.write(text)
+        self._file.flush()
+
+    def reset(self):
+        """Очищает файл перед новой попыткой записи."""
+        self._parts = []
+        self._file.seek(0)
+        self._file.truncate()
+
+    def commit(self, final_path, content):
+        """Переименовывает временный файл в final_path. Если записанный текст отличается от content, перезаписывает его."""
+        if "".join(self._parts) != content:
+            self.reset()
+            self.write(content)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        # mkstemp создает файл с правами 0600; заметка должна читаться как обычный файл хранилища
+        os.chmod(self.tmp_path, 0o644)
+        os.replace(self.tmp_path, final_path)
+        self.committed = True
+
+    def discard(self):
+        """Удаляет временный файл, если заметка не была сохранена."""
+        if self.committed:
+            return
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+def remove_stale_note_parts(directory=None, max_age_seconds=None):
+    """Удаляет брошенные временные файлы заметок (.*.md.part) в хранилище.
 
-    input_path = sys.argv[1]
-    file_extension = os.path.splitext(input_path)[1].lower()
+    NoteWriter убирает свой файл только при исключении в Python; после SIGKILL, OOM или отключения питания
+    файл остается и синхронизируется Syncthing на все устройства. Файл, в который еще пишут, обновляется
+    при каждой порции ответа, поэтому удаляются только файлы старше max_age_seconds.
+    """
+    directory = directory or OBSIDIAN_VAULT_PATH
+    max_age_seconds = NOTE_PART_STALE_SECONDS if max_age_seconds is None else max_age_seconds
+    if not os.path.isdir(directory):
+        return 0
+    now = time.time()
+    removed = 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not (entry.name.startswith('.') and entry.name.endswith(NOTE_PART_SUFFIX)):
+                continue
+            try:
+                if not entry.is_file(follow_symlinks=False) or now - entry.stat().st_mtime < max_age_seconds:
+                    continue
+                os.remove(entry.path)
+                removed += 1
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logging.warning(f"Не удалось удалить временный файл заметки {entry.path}: {e}")
+    if removed:
+        logging.info(f"Удалено брошенных временных файлов заметок: {removed} в {directory}")
+    return removed
+
+class FileJob:
+    """Один файл на пути через этапы обработки: подготовка, транскрипция, анализ LLM и запись заметки."""
+
+    def __init__(self, input_path, force_refresh=False):
+        self.input_path = input_path
+        self.force_refresh = force_refresh
+        self.file_extension = os.path.splitext(input_path)[1].lower()
+        self.is_video_file = False
+        self.ledger_job_id = None
+        self.metrics = None
+        self.transcript = ""
+        self.note_writer = None
+        self.markdown = None
+        self.output_path = None
+        self.error = None
+
+    def __str__(self):
+        return self.input_path
 
+def run_job_step(step, job):
+    """Выполняет этап задания. При ошибке запоминает текст уведомления (или исключение) для журнала заданий."""
+    _last_error.message = None
+    try:
+        step(job)
+    except BaseException as e:
+        job.error = _last_error.message or repr(e)
+        raise
+    return job
+
+def check_input_type(job):
+    """Определяет тип входного файла (медиафайл или текстовый транскрипт) и отклоняет неподдерживаемые."""
     allowed_video_extensions = config.get('File_Filtering', 'allowed_extensions', fallback='').split(',')
     allowed_video_extensions = [ext.strip() for ext in allowed_video_extensions if ext.strip()]
-    
-    is_video_file = False
-    for ext in allowed_video_extensions:
-        if file_extension == ext:
-            is_video_file = True
-            break
-
-    transcript_with_timecodes = ""
-    if is_video_file:
+    job.is_video_file = job.file_extension in allowed_video_extensions
+    if not job.is_video_file and job.file_extension != '.txt':
+        error_message = f"Неподдерживаемый тип входного файла: {job.input_path}. Ожидается видеофайл или текстовый файл транскрипта."
+        logging.error(error_message)
+        send_notification(error_message)
+        sys.exit(1)
+
+def prepare_file(job):
+    """Проверяет тип входного файла и регистрирует его в журнале заданий (хэш содержимого).
+
+    Неподдерживаемые файлы в журнал не попадают, чтобы --resume не повторял их.
+    """
+    check_input_type(job)
+    ledger = get_job_ledger()
+    if ledger is not None and os.path.isfile(job.input_path):
+        job.ledger_job_id = ledger.register(job.input_path, get_transcript_cache().content_hash(job.input_path))['id']
+        ledger.start_attempt(job.ledger_job_id)
+        if job.metrics is not None:
+            job.metrics.fields['ledger_job_id'] = job.ledger_job_id
+
+def transcribe_file(job):
+    """Транскрибирует медиафайл через Deepgram или читает готовый текстовый транскрипт."""
+    input_path = job.input_path
+    if job.is_video_file:
         logging.info(f"Начало транскрипции видео с Deepgram API: {input_path}...")
-        transcript_with_timecodes = transcribe_with_deepgram(input_path)
+        job.transcript = transcribe_with_deepgram(input_path)
         logging.info("Транскрипция завершена.")
-    elif file_extension == '.txt':
+    else:
         logging.info(f"Используем предоставленный текстовый файл как транскрипт: {input_path}...")
         try:
             with open(input_path, 'r', encoding='utf-8') as f:
-                transcript_with_timecodes = f.read()
+                job.transcript = f.read()
             logging.info("Транскрипт успешно прочитан из файла.")
         except Exception as e:
             error_message = f"Ошибка при чтении файла транскрипта {input_path}: {e}"
             logging.error(error_message)
             send_notification(error_message)
             sys.exit(1)
-    else:
-        error_message = f"Неподдерживаемый тип входного файла: {input_path}. Ожидается видеофайл или текстовый файл транскрипта."
-        logging.error(error_message)
-        send_notification(error_message)
-        sys.exit(1)
-    
-    if not transcript_with_timecodes:
+
+    if not job.transcript:
         error_message = "Ошибка: Транскрипция не удалась или вернула пустой результат."
         logging.error(error_message)
         send_notification(error_message)
         sys.exit(1)
 
+def analyze_file(job):
+    """Анализирует транскрипт в LLM; в потоковом режиме ответ сразу пишется во временный файл заметки."""
+    if job.ledger_job_id is not None:
+        get_job_ledger().set_state(job.ledger_job_id, ANALYZING)
+    os.makedirs(OBSIDIAN_VAULT_PATH, exist_ok=True)
+    job.note_writer = NoteWriter(OBSIDIAN_VAULT_PATH)
     logging.info("Начало анализа LLM (NVIDIA API)...")
-    markdown_output = analyze_with_nvidia_llm(transcript_with_timecodes)
+    job.markdown = analyze_with_nvidia_llm(job.transcript, sink=job.note_writer, force_refresh=job.force_refresh)
     logging.info("Анализ LLM (NVIDIA API) завершен.")
-    
-    if markdown_output.startswith("Error"):
-        error_message = f"Ошибка LLM-анализа: {markdown_output}"
+
+    if job.markdown.startswith("Error"):
+        error_message = f"Ошибка LLM-анализа: {job.markdown}"
         logging.error(error_message)
         send_notification(error_message)
         sys.exit(1)
 
+def write_note(job):
+    """Атомарно сохраняет заметку в хранилище Obsidian и отмечает запись в журнале заданий."""
+    markdown_output = job.markdown
     title_line = next((line for line in markdown_output.split('\n') if line.startswith('title:')), None)
     if title_line:
         file_title = title_line.split('title:')[1].strip()
@@ -293,19 +1092,224 @@ def main():
         safe_filename = re.sub(r'[-\s]+', '_', safe_filename)
         filename = f"{safe_filename}.md"
     else:
-        base_name = os.path.basename(input_path)
-        if is_video_file:
-            filename = f"LLM_Analysis_{base_name.replace(file_extension, '.md')}"
+        base_name = os.path.basename(job.input_path)
+        if job.is_video_file:
+            filename = f"LLM_Analysis_{base_name.replace(job.file_extension, '.md')}"
         else: # .txt file
             filename = f"LLM_Analysis_{base_name.replace('.txt', '.md')}"
 
     output_path = os.path.join(OBSIDIAN_VAULT_PATH, filename)
-    os.makedirs(OBSIDIAN_VAULT_PATH, exist_ok=True)
-    
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(markdown_output)
+    if job.ledger_job_id is not None:
+        # Заметка с тем же заголовком от другой записи не перезаписывается
+        output_path = get_job_ledger().claim_output(job.ledger_job_id, output_path)
+    with metrics.stage('write_note'):
+        job.note_writer.commit(output_path, markdown_output)
+    job.output_path = output_path
+    if job.ledger_job_id is not None:
+        get_job_ledger().set_state(job.ledger_job_id, WRITTEN, output_path=output_path)
+    if job.metrics is not None:
+        job.metrics.fields['output_path'] = output_path
 
     logging.info(f"Успех. Obsidian заметка создана: {output_path}")
+
+def fail_job(job):
+    """Отмечает задание в журнале как failed и удаляет недописанную заметку."""
+    if job.ledger_job_id is not None:
+        get_job_ledger().set_state(job.ledger_job_id, FAILED, error=job.error)
+    if job.note_writer is not None:
+        job.note_writer.discard()
+
+FILE_JOB_STEPS = (prepare_file, transcribe_file, analyze_file, write_note)
+
+def process_file(input_path, force_refresh=False):
+    """Полный цикл обработки одного файла: транскрипция, анализ LLM и запись заметки Obsidian.
+
+    Возвращает путь к созданной заметке. Используется как из CLI, так и из демона мониторинга.
+    По завершении в [Metrics] jsonl_path дописывается запись с метриками задания.
+    """
+    job = FileJob(input_path, force_refresh)
+    with metrics.job(input_path, 'ai_analyzer') as job_metrics:
+        job.metrics = job_metrics
+        try:
+            for step in FILE_JOB_STEPS:
+                run_job_step(step, job)
+        except BaseException:
+            fail_job(job)
+            raise
+    return job.output_path
+
+def delete_source_if_written(input_path, output_path=None):
+    """Удаляет исходный файл, только если журнал заданий подтверждает запись заметки для его содержимого.
+
+    При отключенном журнале достаточно того, что заметка output_path существует. Возвращает True, если файл удален.
+    """
+    ledger = get_job_ledger()
+    if ledger is not None:
+        content_hash = get_transcript_cache().content_hash(input_path)
+        confirmed = ledger.confirmed_output(content_hash)
+    else:
+        content_hash = None
+        confirmed = output_path if output_path and os.path.isfile(output_path) else None
+    if not confirmed:
+        logging.warning(f"Запись заметки для {input_path} не подтверждена. Исходный файл не удален.")
+        return False
+    os.remove(input_path)
+    if ledger is not None:
+        ledger.mark_source_deleted(ledger.find(content_hash)['id'])
+    logging.info(f"Заметка подтверждена: {confirmed}. Исходный файл удален: {input_path}")
+    return True
+
+def collect_batch_files(pattern):
+    """Файлы для пакетной обработки: медиафайлы допустимых расширений из папки (рекурсивно) или файлы по glob-шаблону."""
+    pattern = os.path.expanduser(pattern)
+    if os.path.isdir(pattern):
+        allowed_extensions = {ext.strip() for ext in config.get('File_Filtering', 'allowed_extensions', fallback='').split(',') if ext.strip()}
+        paths = [os.path.join(root, name) for root, _, names in os.walk(pattern) for name in names
+                 if os.path.splitext(name)[1].lower() in allowed_extensions and not name.startswith('.')]
+    else:
+        paths = [path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path)]
+    return sorted(paths)
+
+def run_pipeline(paths, delete_source=False, force_refresh=False, retry_failed=False):
+    """Обрабатывает много файлов конвейером (см. [Pipeline]). Возвращает число заданий, завершившихся ошибкой.
+
+    Этапы подготовки, транскрипции, анализа LLM и записи заметки идут параллельно для разных файлов.
+    Файлы с одинаковым содержимым обрабатываются один раз, уже записанные заметки пропускаются,
+    а прерванные задания выполняются заново (сегменты и кэши позволяют не повторять сделанную работу).
+    """
+    ledger = get_job_ledger()
+    if ledger is None:
+        error_message = "Пакетный режим требует журнала заданий: включите [Ledger] enabled."
+        logging.error(error_message)
+        send_notification(error_message)
+        sys.exit(1)
+    logging.info(f"Пакетная обработка: найдено файлов: {len(paths)}")
+
+    cache = get_transcript_cache()
+    seen = set()
+    seen_lock = threading.Lock()
+    skipped = {'done': [], 'duplicates': [], 'failed': 0}
+
+    def admit(job):
+        """Пропускает дубликаты, подтвержденные заметки и задания, исчерпавшие попытки."""
+        try:
+            content_hash = cache.content_hash(job.input_path)
+        except OSError as e:
+            logging.warning(f"Не удалось прочитать {job.input_path}: {e}. Пропускаем.")
+            return False
+        row = ledger.register(job.input_path, content_hash)
+        with seen_lock:
+            if row['id'] in seen:
+                logging.info(f"{job.input_path}: то же содержимое, что и у {row['source_path']}. Пропускаем дубликат.")
+                skipped['duplicates'].append(job.input_path)
+                return False
+            seen.add(row['id'])
+        if not force_refresh and ledger.confirmed_output(content_hash):
+            skipped['done'].append(job.input_path)
+            return False
+        if row['state'] == FAILED and not retry_failed and 0 < LEDGER_MAX_ATTEMPTS <= row['attempts']:
+            logging.info(f"{job.input_path}: попытки исчерпаны ({row['attempts']}), последняя ошибка: {row['error']}. Пропускаем.")
+            skipped['failed'] += 1
+            return False
+        return True
+
+    def stage_handler(stage_name, step, admit_first=False):
+        def handle(job, queue_wait):
+            if job.metrics is None:
+                job.metrics = metrics.JobMetrics(job.input_path, 'pipeline')
+            job.metrics.add_stage(f"queue_{stage_name}", queue_wait)
+            # Суммарное ожидание в очередях — то же поле, что у заданий пула мониторинга
+            job.metrics.fields['queue_wait_seconds'] = round(job.metrics.fields.get('queue_wait_seconds', 0.0) + queue_wait, 3)
+            # Этапы одного файла выполняются в разных потоках, поэтому задание метрик передается явно
+            if admit_first:
+                # Тип файла проверяется до регистрации в журнале: неподдерживаемые файлы туда не попадают
+                metrics.bind(run_job_step, job.metrics)(check_input_type, job)
+                if not admit(job):
+                    return None
+            metrics.bind(run_job_step, job.metrics)(step, job)
+            if step is write_note and delete_source:
+                metrics.bind(delete_source_if_written, job.metrics)(job.input_path, job.output_path)
+            return job
+        return handle
+
+    def on_error(job, stage_name, error):
+        fail_job(job)
+        if job.metrics is not None:
+            metrics.finish(job.metrics, 'failed', job.error or repr(error))
+
+    def on_done(job):
+        metrics.finish(job.metrics, 'ok')
+        # Путь к заметке в stdout, как и при обработке одного файла
+        print(job.output_path, flush=True)
+
+    stages = [
+        Stage('prepare', stage_handler('prepare', prepare_file, admit_first=True), PIPELINE_PREPARE_WORKERS, PIPELINE_QUEUE_SIZE),
+        Stage('transcribe', stage_handler('transcribe', transcribe_file), PIPELINE_TRANSCRIBE_WORKERS, PIPELINE_QUEUE_SIZE),
+        Stage('analyze', stage_handler('analyze', analyze_file), PIPELINE_ANALYZE_WORKERS, PIPELINE_QUEUE_SIZE),
+        Stage('write', stage_handler('write', write_note), PIPELINE_WRITE_WORKERS, PIPELINE_QUEUE_SIZE),
+    ]
+    logging.info("Конвейер: " + ", ".join(f"{stage.name} ×{stage.workers}" for stage in stages) +
+                 f", очередь перед каждым этапом до {PIPELINE_QUEUE_SIZE}")
+    try:
+        failed = Pipeline(stages, on_error=on_error, on_done=on_done).run(FileJob(path, force_refresh) for path in paths)
+    except KeyboardInterrupt:
+        logging.warning("Прерывание: незавершенные задания остались в журнале, продолжить можно с --resume. "
+                        "Уже начатые запросы к API завершаются перед выходом; повторное Ctrl+C прерывает и их.")
+        raise
+    if delete_source:
+        for path in skipped['done'] + skipped['duplicates']:
+            if os.path.exists(path):
+                delete_source_if_written(path)
+
+    logging.info(f"Пропущено: уже записано {len(skipped['done'])}, дубликатов {len(skipped['duplicates'])}, "
+                 f"после {LEDGER_MAX_ATTEMPTS} неудачных попыток {skipped['failed']}. Журнал заданий: {ledger.counts()}")
+    return failed
+
+def main():
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[
+                            logging.FileHandler("ai_analyzer.log"),
+                            logging.StreamHandler(sys.stderr)
+                        ])
+    logging.info("Запуск скрипта ai_analyzer.py")
+    parser = argparse.ArgumentParser(description="Транскрипция, анализ LLM и создание заметки Obsidian.")
+    parser.add_argument("input_paths", nargs="*", metavar="input_path",
+                        help="путь к видео/аудиофайлу или текстовому файлу транскрипта; несколько файлов обрабатываются конвейером")
+    parser.add_argument("--force-refresh", action="store_true",
+                        help="не использовать кэш анализа LLM и выполнить запрос заново")
+    parser.add_argument("--delete-source", action="store_true",
+                        help="удалить исходный файл после того, как журнал заданий подтвердит запись заметки")
+    parser.add_argument("--batch", metavar="PATH_OR_GLOB",
+                        help="пакетная обработка папки (рекурсивно) или glob-шаблона, например '~/archive/**/*.mp4'")
+    parser.add_argument("--resume", action="store_true",
+                        help="продолжить незавершенные и упавшие задания из журнала")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="в пакетном режиме повторить задания, исчерпавшие [Ledger] max_attempts")
+    args = parser.parse_args()
+    remove_stale_note_parts()
+
+    if args.batch or args.resume or len(args.input_paths) > 1:
+        if args.batch:
+            paths = collect_batch_files(args.batch)
+        elif args.resume:
+            ledger = get_job_ledger()
+            jobs = ledger.unfinished(0 if args.retry_failed else LEDGER_MAX_ATTEMPTS) if ledger is not None else []
+            paths = [job['source_path'] for job in jobs if os.path.isfile(job['source_path'])]
+        else:
+            paths = args.input_paths
+        failed = run_pipeline(paths, delete_source=args.delete_source,
+                              force_refresh=args.force_refresh, retry_failed=args.retry_failed)
+        sys.exit(1 if failed else 0)
+    if not args.input_paths:
+        parser.error("укажите input_path, --batch или --resume")
+
+    input_path = args.input_paths[0]
+    output_path = process_file(input_path, force_refresh=args.force_refresh)
+    if args.delete_source:
+        delete_source_if_written(input_path, output_path)
+    # Путь к заметке в stdout читает obsidian-ai-transcribe.sh; логи идут в stderr
+    print(output_path)
     return output_path
 
 if __name__ == "__main__":
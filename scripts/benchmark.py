@@ -0,0 +1,210 @@
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import logging
+import argparse
+import resource
+import tempfile
+import functools
+import subprocess
+import urllib.request
+from datetime import datetime, timezone
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT = os.path.join(SCRIPTS_DIR, "..", "benchmark_results.jsonl")
+
+def percentile(values, fraction):
+    """Перцентиль методом ближайшего ранга."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def fetch_stats(base_url):
+    with urllib.request.urlopen(f"{base_url}/stats", timeout=5) as response:
+        return json.load(response)
+
+def start_mock_server(args):
+    """Запускает заглушки API отдельным процессом, чтобы их память не попадала в замер RSS."""
+    port = free_port()
+    command = [sys.executable, os.path.join(SCRIPTS_DIR, "mock_api_server.py"), "--port", str(port),
+               "--deepgram-latency", str(args.deepgram_latency), "--deepgram-words", str(args.deepgram_words),
+               "--upload-mbps", str(args.upload_mbps), "--llm-ttft", str(args.llm_ttft),
+               "--llm-tokens-per-second", str(args.llm_tokens_per_second), "--error-rate", str(args.error_rate)]
+    process = subprocess.Popen(command)
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            fetch_stats(base_url)
+            return process, base_url
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("заглушки API не запустились")
+
+def create_media_files(directory, count, size_mb, duration_seconds, use_ffmpeg):
+    """Создает синтетические входные файлы: настоящее аудио через ffmpeg или случайные байты."""
+    paths = []
+    for index in range(count):
+        if use_ffmpeg:
+            path = os.path.join(directory, f"bench_{index:04d}.wav")
+            subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-f", "lavfi",
+                            "-i", f"sine=frequency={220 + index}:duration={duration_seconds}", path], check=True)
+        else:
+            path = os.path.join(directory, f"bench_{index:04d}.mp4")
+            with open(path, 'wb') as f:
+                f.write(os.urandom(int(size_mb * 1024 * 1024)))
+        paths.append(path)
+    return paths
+
+def instrument(module, name, timings):
+    """Оборачивает функцию модуля замером длительности каждого вызова."""
+    original = getattr(module, name)
+    @functools.wraps(original)
+    def timed(*args, **kwargs):
+        started = time.monotonic()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            timings.append(time.monotonic() - started)
+    setattr(module, name, timed)
+
+def configure_analyzer(ai_analyzer, base_url, workdir, args):
+    """Направляет реальный код анализатора на заглушки и временные каталоги."""
+    ai_analyzer.DEEPGRAM_URL = f"{base_url}/v1/listen"
+    ai_analyzer.NVIDIA_API_URL = f"{base_url}/v1/chat/completions"
+    ai_analyzer.DEEPGRAM_API_KEY = "benchmark"
+    ai_analyzer.NVIDIA_API_KEY = "benchmark"
+    ai_analyzer.OBSIDIAN_VAULT_PATH = os.path.join(workdir, "vault")
+    ai_analyzer.TRANSCRIPT_CACHE_DIR = os.path.join(workdir, "cache")
+    ai_analyzer.ANALYSIS_CACHE_DIR = os.path.join(workdir, "analysis_cache")
+    ai_analyzer.ANALYSIS_CACHE_ENABLED = False
+    ai_analyzer.LEDGER_PATH = os.path.join(workdir, "ledger.sqlite")
+    ai_analyzer.AUDIO_EXTRACTION_ENABLED = args.extract_audio
+    ai_analyzer.NVIDIA_STREAM = not args.no_stream
+    # Бенчмарк ведет собственный отчет и не дописывает записи в metrics.jsonl проекта
+    ai_analyzer.metrics.configure(None)
+    if not args.keep_rate_limits:
+        ai_analyzer.DEEPGRAM_REQUESTS_PER_MINUTE = 0
+        ai_analyzer.NVIDIA_REQUESTS_PER_MINUTE = 0
+    ai_analyzer._transcript_cache = None
+    ai_analyzer._analysis_cache = None
+    ai_analyzer._deepgram_client = None
+    ai_analyzer._nvidia_client = None
+    ai_analyzer._job_ledger = None
+
+def run_benchmark(args):
+    sys.path.insert(0, SCRIPTS_DIR)
+    import ai_analyzer
+    from worker_pool import WorkerPool
+
+    workdir = tempfile.mkdtemp(prefix="oaa-bench-")
+    mock_process, base_url = start_mock_server(args)
+    try:
+        configure_analyzer(ai_analyzer, base_url, workdir, args)
+        stage_timings = {'transcribe': [], 'analyze': [], 'write': []}
+        instrument(ai_analyzer, 'transcribe_with_deepgram', stage_timings['transcribe'])
+        instrument(ai_analyzer, 'analyze_with_nvidia_llm', stage_timings['analyze'])
+        instrument(ai_analyzer.NoteWriter, 'commit', stage_timings['write'])
+
+        input_dir = os.path.join(workdir, "input")
+        os.makedirs(input_dir)
+        files = create_media_files(input_dir, args.files, args.file_size_mb, args.duration_seconds, args.extract_audio)
+        input_bytes = sum(os.path.getsize(path) for path in files)
+
+        job_timings = []
+        def run_job(path):
+            started = time.monotonic()
+            try:
+                ai_analyzer.process_file(path)
+            finally:
+                job_timings.append(time.monotonic() - started)
+
+        pool = WorkerPool(run_job, workers=args.workers, name="bench")
+        started = time.monotonic()
+        pool.start()
+        for path in files:
+            pool.submit(path)
+        pool.shutdown(drain=True)
+        elapsed = time.monotonic() - started
+        pool_stats = pool.stats()
+        server_stats = fetch_stats(base_url)
+    finally:
+        mock_process.terminate()
+        mock_process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    def summarize(values):
+        return {'count': len(values), 'p50': percentile(values, 0.5), 'p95': percentile(values, 0.95),
+                'max': max(values) if values else None}
+
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'label': args.label,
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'label', 'verbose')},
+        'files': args.files,
+        'completed': pool_stats['completed'],
+        'failed': pool_stats['failed'],
+        'wall_seconds': round(elapsed, 3),
+        'files_per_minute': round(pool_stats['completed'] / elapsed * 60, 2) if elapsed > 0 else None,
+        'stages': {name: summarize(values) for name, values in stage_timings.items()},
+        'job': summarize(job_timings),
+        # На Linux ru_maxrss в килобайтах
+        'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        'input_bytes': input_bytes,
+        'bytes_uploaded': server_stats['deepgram_bytes_received'],
+        'bytes_sent_to_llm': server_stats['nvidia_bytes_received'],
+        'server': server_stats,
+    }
+
+def print_report(result):
+    print(f"Файлов: {result['completed']}/{result['files']} (ошибок: {result['failed']}) за {result['wall_seconds']:.1f} с, "
+          f"{result['files_per_minute']} файлов/мин")
+    for name, stats in list(result['stages'].items()) + [('job', result['job'])]:
+        if stats['count']:
+            print(f"  {name:<10} p50 {stats['p50']:.3f} с  p95 {stats['p95']:.3f} с  max {stats['max']:.3f} с  (n={stats['count']})")
+    print(f"Пиковый RSS: {result['peak_rss_bytes'] / 1024 / 1024:.1f} МБ")
+    print(f"Загружено в Deepgram: {result['bytes_uploaded']} байт (входные файлы: {result['input_bytes']} байт), "
+          f"отправлено в LLM: {result['bytes_sent_to_llm']} байт, запросов к LLM: {result['server']['nvidia_requests']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк конвейера transcribe → analyze → запись заметки "
+                                                 "на локальных заглушках Deepgram и NVIDIA API.")
+    parser.add_argument("--files", type=int, default=10, help="число синтетических файлов")
+    parser.add_argument("--file-size-mb", type=float, default=5, help="размер файла из случайных байт, МБ")
+    parser.add_argument("--extract-audio", action="store_true",
+                        help="генерировать настоящее аудио через ffmpeg и включить извлечение аудио")
+    parser.add_argument("--duration-seconds", type=float, default=60, help="длительность аудио при --extract-audio")
+    parser.add_argument("--workers", type=int, default=2, help="число параллельных исполнителей")
+    parser.add_argument("--no-stream", action="store_true", help="отключить потоковый ответ LLM")
+    parser.add_argument("--keep-rate-limits", action="store_true", help="сохранить ограничения частоты из config.ini")
+    parser.add_argument("--deepgram-latency", type=float, default=1.0)
+    parser.add_argument("--deepgram-words", type=int, default=6000)
+    parser.add_argument("--upload-mbps", type=float, default=100.0)
+    parser.add_argument("--llm-ttft", type=float, default=0.5)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--label", default="", help="метка запуска для сравнения результатов")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="файл JSONL, в который дописывается результат")
+    parser.add_argument("--verbose", action="store_true", help="выводить логи анализатора")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    result = run_benchmark(args)
+    print_report(result)
+    with open(args.output, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    print(f"Результат дописан в {os.path.abspath(args.output)}")
+
+if __name__ == "__main__":
+    main()
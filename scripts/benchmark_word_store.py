@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime, timezone
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT = os.path.join(SCRIPTS_DIR, "..", "benchmark_results.jsonl")
+sys.path.insert(0, SCRIPTS_DIR)
+
+from word_store import WordStore, TIME_SCALE
+from transcript_segments import iter_words, build_segments_from_columns, format_segments
+
+def peak_rss_bytes():
+    """Пиковый RSS процесса. ru_maxrss наследуется от родителя через fork/exec, поэтому сначала читается VmHWM."""
+    try:
+        with open("/proc/self/status", encoding='ascii') as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # На Linux ru_maxrss в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def build_segments_from_json(data):
+    """Базовый вариант для сравнения: разбор всего ответа Deepgram и словарь Python на каждое слово."""
+    words = list(iter_words(data))
+    return build_segments_from_columns([w['word'] for w in words], range(len(words)), [w['start'] for w in words],
+                                       [w['end'] for w in words], [w['speaker'] for w in words])
+
+def measure(mode, path):
+    """Один замер в отдельном процессе: загрузка кэша и сборка транскрипта так, как это делает анализатор."""
+    baseline_rss = peak_rss_bytes()
+    started = time.perf_counter()
+    if mode == 'json':
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        loaded = time.perf_counter()
+        segments = build_segments_from_json(data)
+    else:
+        store = WordStore.load(path)
+        loaded = time.perf_counter()
+        segments = build_segments_from_columns(store.vocab, store.word_ids, store.starts, store.ends, store.speakers,
+                                               scale=TIME_SCALE)
+    transcript = format_segments(segments)
+    finished = time.perf_counter()
+    return {
+        'load_seconds': loaded - started,
+        'total_seconds': finished - started,
+        'rss_delta_bytes': peak_rss_bytes() - baseline_rss,
+        'transcript_chars': len(transcript),
+    }
+
+def run_measurement(mode, path):
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "--measure", mode, path],
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение загрузки кэша транскрипта: JSON-ответ Deepgram "
+                                                 "против колоночного хранилища слов (.words, mmap).")
+    parser.add_argument("--words", type=int, default=200000, help="число слов в синтетическом ответе (~3 ч речи)")
+    parser.add_argument("--repeat", type=int, default=5, help="число замеров каждого варианта (берется медиана)")
+    parser.add_argument("--label", default="", help="метка запуска для сравнения результатов")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="файл JSONL, в который дописывается результат")
+    parser.add_argument("--measure", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+        return
+
+    from mock_api_server import build_deepgram_response
+    workdir = tempfile.mkdtemp(prefix="oaa-words-")
+    try:
+        data = build_deepgram_response(args.words)
+        json_path = os.path.join(workdir, "entry.json")
+        words_path = os.path.join(workdir, "entry.words")
+        # Так же, как TranscriptCache.put: компактный JSON
+        with open(json_path, 'wb') as f:
+            f.write(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        with open(words_path, 'wb') as f:
+            f.write(WordStore.from_deepgram(data).to_bytes())
+        del data
+
+        result = {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'benchmark': 'word_store',
+            'label': args.label,
+            'words': args.words,
+        }
+        for mode, path in (('json', json_path), ('words', words_path)):
+            runs = [run_measurement(mode, path) for _ in range(args.repeat)]
+            result[mode] = {
+                'file_bytes': os.path.getsize(path),
+                'load_seconds': statistics.median(run['load_seconds'] for run in runs),
+                'total_seconds': statistics.median(run['total_seconds'] for run in runs),
+                'rss_delta_bytes': statistics.median(run['rss_delta_bytes'] for run in runs),
+                'transcript_chars': runs[0]['transcript_chars'],
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if result['json']['transcript_chars'] != result['words']['transcript_chars']:
+        print("Внимание: транскрипты из JSON и из хранилища слов различаются по длине", file=sys.stderr)
+    print(f"Слов: {args.words}, медиана по {args.repeat} замерам")
+    for mode in ('json', 'words'):
+        stats = result[mode]
+        print(f"  {mode:<6} файл {stats['file_bytes'] / 1024 / 1024:7.1f} МБ  загрузка {stats['load_seconds'] * 1000:8.1f} мс  "
+              f"до транскрипта {stats['total_seconds'] * 1000:8.1f} мс  прирост RSS {stats['rss_delta_bytes'] / 1024 / 1024:7.1f} МБ")
+    with open(args.output, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    print(f"Результат дописан в {os.path.abspath(args.output)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """Ограничитель частоты запросов "ведро токенов", общий для всех потоков процесса."""
+
+    def __init__(self, rate_per_minute, burst=1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Ждет, пока в ведре появится токен, и забирает его. Возвращает время ожидания в секундах."""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+def parse_retry_after(value):
+    """Разбирает заголовок Retry-After (секунды или HTTP-дата). Возвращает задержку в секундах или None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class ApiClient:
+    """HTTP-клиент одного API: пул соединений (keep-alive), таймауты, повторы с экспоненциальной
+    задержкой и джиттером (с учетом Retry-After) и общий ограничитель частоты запросов."""
+
+    def __init__(self, name, rate_per_minute=0, burst=1, connect_timeout=10, read_timeout=300,
+                 max_retries=5, backoff_base=1.0, backoff_max=60.0, pool_size=10):
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = TokenBucket(rate_per_minute, burst)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _backoff(self, attempt, response=None):
+        retry_after = parse_retry_after(response.headers.get('Retry-After')) if response is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        # "Полный джиттер": случайная задержка от 0 до base * 2^attempt
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def post(self, url, timeout=None, **kwargs):
+        """POST с повторами при сетевых ошибках и ответах 408/429/5xx.
+
+        Тело запроса (data) должно допускать повторное чтение: файл открывается заново для каждой попытки.
+        Возвращает последний ответ; проверка статуса (raise_for_status) остается за вызывающим кодом.
+        """
+        timeout = timeout or self.timeout
+        for attempt in range(self.max_retries + 1):
+            waited = self.rate_limiter.acquire()
+            if waited > 0:
+                metrics.add('rate_limit_wait_seconds', round(waited, 3))
+            if waited >= 1:
+                logging.info(f"{self.name}: ограничение частоты запросов, ожидание {waited:.1f} с")
+            try:
+                response = self.session.post(url, timeout=timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                metrics.add('http_retries')
+                logging.warning(f"{self.name}: сетевая ошибка ({e}). Повтор {attempt + 1}/{self.max_retries} через {delay:.1f} с")
+                time.sleep(delay)
+                continue
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                return response
+            delay = self._backoff(attempt, response)
+            metrics.add('http_retries')
+            logging.warning(f"{self.name}: HTTP {response.status_code}. Повтор {attempt + 1}/{self.max_retries} через {delay:.1f} с")
+            response.close()
+            time.sleep(delay)
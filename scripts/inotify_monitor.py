@@ -1,12 +1,17 @@
 import sys
 import time
+import signal
 import logging
 import os
 import configparser
 import subprocess
+import threading
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
+import metrics
+from worker_pool import WorkerPool
+
 # --- КОНФИГУРАЦИЯ ---
 CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config.ini")
 config = configparser.ConfigParser()
@@ -15,6 +20,26 @@ config.read(CONFIG_FILE)
 WATCH_DIR = os.path.expanduser(config.get('Paths', 'watch_directory'))
 OBSIDIAN_TRANSCRIBE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "obsidian-ai-transcribe.sh")
 LOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".inotify_monitor.log")
+
+# daemon — анализатор импортируется один раз и файлы обрабатываются в пуле потоков этого процесса;
+# subprocess — для каждого файла запускается obsidian-ai-transcribe.sh (число одновременных запусков ограничено пулом)
+PROCESSING_MODE = config.get('Monitor', 'mode', fallback='daemon').strip().lower()
+MAX_WORKERS = config.getint('Monitor', 'workers', fallback=2)
+MAX_QUEUE_SIZE = config.getint('Monitor', 'queue_size', fallback=0)
+STATUS_INTERVAL = config.getfloat('Monitor', 'status_interval', fallback=60)
+
+# Файл считается записанным, если его размер и mtime не менялись stability_seconds
+# (или closed_grace_seconds после события закрытия файла, открытого на запись)
+STABILITY_SECONDS = config.getfloat('Monitor', 'stability_seconds', fallback=10)
+CLOSED_GRACE_SECONDS = config.getfloat('Monitor', 'closed_grace_seconds', fallback=1)
+POLL_INTERVAL = config.getfloat('Monitor', 'poll_interval', fallback=1)
+SCAN_ON_STARTUP = config.getboolean('Monitor', 'scan_on_startup', fallback=True)
+
+# Метрики заданий пишутся в тот же JSONL, что и у ai_analyzer.py; prometheus_port > 0 включает эндпоинт /metrics
+METRICS_ENABLED = config.getboolean('Metrics', 'enabled', fallback=True)
+METRICS_JSONL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", config.get('Metrics', 'jsonl_path', fallback='metrics.jsonl'))
+PROMETHEUS_HOST = config.get('Metrics', 'prometheus_host', fallback='127.0.0.1')
+PROMETHEUS_PORT = config.getint('Metrics', 'prometheus_port', fallback=0)
 # --------------------
 
 logging.basicConfig(level=logging.INFO,
@@ -25,14 +50,124 @@ logging.basicConfig(level=logging.INFO,
                         logging.StreamHandler()
                     ])
 
+def run_in_process(file_path):
+    """Обрабатывает файл анализатором, импортированным в текущий процесс, и удаляет исходник,
+    когда журнал заданий подтвердит запись заметки."""
+    import ai_analyzer
+    output_path = ai_analyzer.process_file(file_path)
+    if not ai_analyzer.delete_source_if_written(file_path, output_path):
+        raise RuntimeError(f"Запись заметки для {file_path} не подтверждена, исходный файл не удален.")
+
+def run_in_subprocess(file_path):
+    """Обрабатывает файл отдельным запуском obsidian-ai-transcribe.sh и ждет его завершения."""
+    # Убедитесь, что obsidian-ai-transcribe.sh имеет права на выполнение
+    command = [OBSIDIAN_TRANSCRIBE_SCRIPT, file_path]
+    logging.info(f"Запуск обработки файла {file_path}: {' '.join(command)}")
+    result = subprocess.run(command)
+    if result.returncode != 0:
+        raise RuntimeError(f"{OBSIDIAN_TRANSCRIBE_SCRIPT} завершился с кодом {result.returncode}")
+
+class FileStabilityTracker:
+    """Отслеживает появившиеся файлы и передает их в пул только после завершения записи."""
+
+    def __init__(self, submit, stability_seconds=STABILITY_SECONDS, closed_grace_seconds=CLOSED_GRACE_SECONDS):
+        self.submit = submit
+        self.stability_seconds = stability_seconds
+        self.closed_grace_seconds = closed_grace_seconds
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._in_progress = set()
+
+    def track(self, file_path, reason):
+        """Начинает наблюдение за файлом. Повторные события для того же файла объединяются."""
+        with self._lock:
+            if file_path in self._in_progress:
+                logging.info(f"Файл {file_path} уже в обработке, событие '{reason}' пропущено.")
+                return
+            if file_path in self._pending:
+                return
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                return
+            self._pending[file_path] = {
+                'detected_at': time.time(),
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'last_change': stat.st_mtime,
+                'closed': False,
+            }
+        logging.info(f"Файл {file_path} ({reason}) ожидает завершения записи...")
+
+    def mark_closed(self, file_path):
+        """Событие закрытия файла после записи: ожидание сокращается до closed_grace_seconds."""
+        with self._lock:
+            entry = self._pending.get(file_path)
+            if entry is not None:
+                entry['closed'] = True
+
+    def release(self, file_path):
+        """Снимает отметку об обработке, чтобы новый файл с тем же именем снова был принят."""
+        with self._lock:
+            self._in_progress.discard(file_path)
+
+    def check(self):
+        """Проверяет ожидающие файлы и передает в пул те, что перестали изменяться."""
+        now = time.time()
+        ready = []
+        with self._lock:
+            for file_path, entry in list(self._pending.items()):
+                try:
+                    stat = os.stat(file_path)
+                except FileNotFoundError:
+                    logging.info(f"Файл {file_path} исчез до завершения записи. Пропускаю.")
+                    del self._pending[file_path]
+                    continue
+                if (stat.st_size, stat.st_mtime_ns) != (entry['size'], entry['mtime_ns']):
+                    entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns, last_change=max(now, stat.st_mtime))
+                    continue
+                required_quiet = self.closed_grace_seconds if entry['closed'] else self.stability_seconds
+                if now - entry['last_change'] < required_quiet:
+                    continue
+                del self._pending[file_path]
+                if stat.st_size == 0:
+                    logging.info(f"Файл {file_path} пуст. Пропускаю.")
+                    continue
+                self._in_progress.add(file_path)
+                ready.append((file_path, entry))
+        for file_path, entry in ready:
+            waited = now - entry['detected_at']
+            logging.info(f"Файл {file_path} записан полностью ({entry['size']} байт, "
+                         f"{'событие закрытия' if entry['closed'] else 'окно стабильности'}), ожидание: {waited:.1f} с")
+            if not self.submit(file_path):
+                self.release(file_path)
+
+    def run(self, stop_event, poll_interval=POLL_INTERVAL):
+        while not stop_event.wait(poll_interval):
+            self.check()
+
 class NewFileHandler(FileSystemEventHandler):
+    def __init__(self, tracker):
+        super().__init__()
+        self.tracker = tracker
+
     def on_created(self, event):
         if not event.is_directory:
             file_path = event.src_path
             logging.info(f"Обнаружен новый файл: {file_path}")
-            self.process_file(file_path)
+            self.process_file(file_path, "создан")
 
-    def process_file(self, file_path):
+    def on_moved(self, event):
+        # Переименование в папку наблюдения (например, Syncthing пишет во временный файл)
+        if not event.is_directory and os.path.dirname(os.path.abspath(event.dest_path)) == os.path.abspath(WATCH_DIR):
+            logging.info(f"Файл перемещен в папку наблюдения: {event.dest_path}")
+            self.process_file(event.dest_path, "перемещен")
+
+    def on_closed(self, event):
+        if not event.is_directory:
+            self.tracker.mark_closed(event.src_path)
+
+    def process_file(self, file_path, reason="обнаружен"):
         allowed_extensions_str = config.get('File_Filtering', 'allowed_extensions', fallback='')
         allowed_extensions = [ext.strip() for ext in allowed_extensions_str.split(',') if ext.strip()]
 
@@ -41,31 +176,94 @@ class NewFileHandler(FileSystemEventHandler):
         if allowed_extensions and file_extension not in allowed_extensions:
             logging.info(f"Файл {file_path} имеет неподдерживаемое расширение ({file_extension}). Пропускаю.")
             return
-        
-        logging.info(f"Начинаю обработку файла: {file_path}")
-        # Вызываем основной скрипт обработки
-        # Убедитесь, что obsidian-ai-transcribe.sh имеет права на выполнение
-        command = [OBSIDIAN_TRANSCRIBE_SCRIPT, file_path]
-        logging.info(f"Запуск обработки файла {file_path} в фоновом режиме: {' '.join(command)}")
-        try:
-            subprocess.Popen(command) 
-            logging.info(f"Файл {file_path} передан для фоновой обработки.")
-        except Exception as e:
-            logging.error(f"Ошибка при запуске обработки файла {file_path}: {e}")
+
+        self.tracker.track(file_path, reason)
+
+def scan_existing_files(event_handler):
+    """Ставит в обработку файлы, появившиеся в папке наблюдения, пока монитор не работал."""
+    started = time.monotonic()
+    found = 0
+    with os.scandir(WATCH_DIR) as entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False) and not entry.name.startswith('.'):
+                found += 1
+                event_handler.process_file(entry.path, "найден при запуске")
+    logging.info(f"Начальное сканирование {WATCH_DIR}: найдено файлов: {found} за {time.monotonic() - started:.3f} с")
 
 def main():
-    logging.info(f"Запуск мониторинга папки: {WATCH_DIR} с inotify...")
-    event_handler = NewFileHandler()
+    if PROCESSING_MODE == 'daemon':
+        logging.info("Режим демона: загружаем анализатор в процесс мониторинга...")
+        import ai_analyzer  # импорт и чтение конфигурации выполняются один раз
+        # В режиме subprocess это делает каждый запуск ai_analyzer.py
+        ai_analyzer.remove_stale_note_parts()
+        handler = run_in_process
+    elif PROCESSING_MODE == 'subprocess':
+        handler = run_in_subprocess
+    else:
+        logging.error(f"Неизвестный режим обработки '{PROCESSING_MODE}' (ожидается daemon или subprocess).")
+        sys.exit(1)
+
+    tracker = None
+    def run_job(file_path):
+        try:
+            handler(file_path)
+        finally:
+            tracker.release(file_path)
+
+    metrics.configure(METRICS_JSONL_PATH if METRICS_ENABLED else None)
+    pool = WorkerPool(run_job, workers=MAX_WORKERS, max_queue=MAX_QUEUE_SIZE, name="transcribe")
+    pool.start()
+    if PROMETHEUS_PORT > 0:
+        metrics.registry.register_gauge('oaa_queue_depth', lambda: pool.stats()['queued'], "Заданий в очереди")
+        metrics.registry.register_gauge('oaa_active_workers', lambda: pool.stats()['active'], "Заданий в обработке")
+        metrics.start_http_server(PROMETHEUS_HOST, PROMETHEUS_PORT)
+    tracker = FileStabilityTracker(pool.submit)
+
+    stop_event = threading.Event()
+    received_signals = []
+    def request_stop(signum, frame):
+        # В обработчике сигнала только выставляем флаг: логирование здесь не реентерабельно
+        if stop_event.is_set():
+            # Повторный сигнал: оператор не хочет ждать активные задания
+            os.write(sys.stderr.fileno(), f"Повторный сигнал {signal.Signals(signum).name}, немедленный выход.\n".encode('utf-8'))
+            os._exit(128 + signum)
+        received_signals.append(signum)
+        stop_event.set()
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    logging.info(f"Запуск мониторинга папки: {WATCH_DIR} с inotify (режим: {PROCESSING_MODE})...")
+    logging.info(f"Ожидание завершения записи: {STABILITY_SECONDS} с без изменений "
+                 f"({CLOSED_GRACE_SECONDS} с после закрытия файла), интервал проверки: {POLL_INTERVAL} с")
+    event_handler = NewFileHandler(tracker)
     observer = Observer()
     observer.schedule(event_handler, WATCH_DIR, recursive=False)
     observer.start()
-    try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        observer.stop()
+    if SCAN_ON_STARTUP:
+        scan_existing_files(event_handler)
+    tracker_thread = threading.Thread(target=tracker.run, args=(stop_event,), name="stability-tracker", daemon=True)
+    tracker_thread.start()
+
+    last_status = time.monotonic()
+    while not stop_event.wait(1):
+        if STATUS_INTERVAL > 0 and time.monotonic() - last_status >= STATUS_INTERVAL:
+            stats = pool.stats()
+            if stats['queued'] or stats['active']:
+                logging.info(f"Состояние пула: в очереди {stats['queued']}, активных {stats['active']}/{stats['workers']}, "
+                             f"выполнено {stats['completed']}, с ошибкой {stats['failed']}")
+            last_status = time.monotonic()
+
+    logging.info(f"Получен сигнал {signal.Signals(received_signals[0]).name}, завершаем работу...")
+    observer.stop()
     observer.join()
+    tracker_thread.join()
+    # Дорабатываются только активные задания, чтобы остановка уложилась в таймаут (TimeoutStopSec у systemd).
+    # Поставленные в очередь файлы остаются в папке наблюдения и будут найдены сканированием при следующем запуске.
+    if pool.stats()['queued'] and not SCAN_ON_STARTUP:
+        logging.warning("scan_on_startup выключен: файлы из очереди не будут обработаны после перезапуска автоматически.")
+    logging.info("Повторный сигнал прервет и активные задания.")
+    pool.shutdown(drain=False)
     logging.info("Мониторинг остановлен.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,145 @@
+import os
+import time
+import sqlite3
+import threading
+
+QUEUED = 'queued'
+TRANSCRIBING = 'transcribing'
+ANALYZING = 'analyzing'
+WRITTEN = 'written'
+FAILED = 'failed'
+STATES = (QUEUED, TRANSCRIBING, ANALYZING, WRITTEN, FAILED)
+# Задания в этих состояниях не завершены: процесс остановился или упал во время обработки
+UNFINISHED_STATES = (QUEUED, TRANSCRIBING, ANALYZING)
+
+class JobLedger:
+    """Журнал заданий в SQLite: одна запись на содержимое файла (хэш), состояние, попытки, ошибка и путь заметки.
+
+    Переживает перезапуск процесса, поэтому по нему можно продолжить пакетную обработку
+    и удалять исходный файл только после подтвержденной записи заметки.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                                id INTEGER PRIMARY KEY,
+                                content_hash TEXT NOT NULL UNIQUE,
+                                source_path TEXT NOT NULL,
+                                state TEXT NOT NULL,
+                                attempts INTEGER NOT NULL DEFAULT 0,
+                                error TEXT,
+                                output_path TEXT,
+                                source_deleted INTEGER NOT NULL DEFAULT 0,
+                                created REAL NOT NULL,
+                                updated REAL NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def register(self, source_path, content_hash):
+        """Возвращает запись задания для содержимого, создавая ее в состоянии queued при первом появлении.
+
+        Для уже известного содержимого запись не меняется, кроме пути к исходнику, если прежний файл исчез.
+        """
+        now = time.time()
+        source_path = os.path.abspath(source_path)
+        with self._lock, self._connect() as conn:
+            conn.execute("""INSERT INTO jobs (content_hash, source_path, state, created, updated) VALUES (?, ?, ?, ?, ?)
+                            ON CONFLICT(content_hash) DO NOTHING""", (content_hash, source_path, QUEUED, now, now))
+            row = conn.execute("SELECT * FROM jobs WHERE content_hash = ?", (content_hash,)).fetchone()
+            if row['source_path'] != source_path and not os.path.exists(row['source_path']):
+                conn.execute("UPDATE jobs SET source_path = ?, source_deleted = 0 WHERE id = ?", (source_path, row['id']))
+                row = conn.execute("SELECT * FROM jobs WHERE id = ?", (row['id'],)).fetchone()
+            return dict(row)
+
+    def start_attempt(self, job_id):
+        """Начинает новую попытку: увеличивает счетчик попыток и сбрасывает прежнюю ошибку.
+
+        Запись в состоянии written остается в нем (см. set_state).
+        """
+        with self._lock, self._connect() as conn:
+            conn.execute("""UPDATE jobs SET state = CASE WHEN state = ? THEN state ELSE ? END,
+                                            attempts = attempts + 1, error = NULL, updated = ? WHERE id = ?""",
+                         (WRITTEN, TRANSCRIBING, time.time(), job_id))
+
+    def set_state(self, job_id, state, error=None, output_path=None):
+        """Меняет состояние задания. Успешная запись (written) сбрасывает счетчик попыток.
+
+        Состояние written не понижается: при повторной обработке уже записанного содержимого
+        (например, --force-refresh) заметка остается подтвержденной, пока новая запись не завершится,
+        а ошибка новой попытки только сохраняется в error.
+        """
+        if state not in STATES:
+            raise ValueError(f"неизвестное состояние задания: {state}")
+        with self._lock, self._connect() as conn:
+            if state == WRITTEN:
+                conn.execute("""UPDATE jobs SET state = ?, attempts = 0, error = NULL, output_path = COALESCE(?, output_path),
+                                                updated = ? WHERE id = ?""", (WRITTEN, output_path, time.time(), job_id))
+            else:
+                conn.execute("""UPDATE jobs SET state = CASE WHEN state = ? THEN state ELSE ? END, error = ?,
+                                                updated = ? WHERE id = ?""", (WRITTEN, state, error, time.time(), job_id))
+
+    def claim_output(self, job_id, output_path):
+        """Закрепляет за заданием путь заметки и возвращает его.
+
+        Имя заметки берется из заголовка LLM, поэтому разные записи могут получить одно имя. Если путь уже
+        закреплен за другим заданием, выбирается первое свободное имя с суффиксом _2, _3, ..., чтобы не
+        перезаписать чужую заметку (иначе журнал подтвердил бы обе записи, а исходники обеих были бы удалены).
+        """
+        base, extension = os.path.splitext(output_path)
+        candidate = output_path
+        suffix = 1
+        with self._lock, self._connect() as conn:
+            # Проверка и закрепление в одной транзакции: журнал общий для нескольких процессов
+            conn.execute("BEGIN IMMEDIATE")
+            while conn.execute("SELECT 1 FROM jobs WHERE output_path = ? AND id != ?", (candidate, job_id)).fetchone():
+                suffix += 1
+                candidate = f"{base}_{suffix}{extension}"
+            # У записанного задания путь подтвержденной заметки меняется только set_state(written)
+            conn.execute("UPDATE jobs SET output_path = ?, updated = ? WHERE id = ? AND state != ?",
+                         (candidate, time.time(), job_id, WRITTEN))
+        return candidate
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def find(self, content_hash):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE content_hash = ?", (content_hash,)).fetchone()
+        return dict(row) if row else None
+
+    def confirmed_output(self, content_hash):
+        """Путь к заметке, если журнал подтверждает успешную запись и файл заметки на месте, иначе None."""
+        job = self.find(content_hash)
+        if job and job['state'] == WRITTEN and job['output_path'] and os.path.isfile(job['output_path']):
+            return job['output_path']
+        return None
+
+    def mark_source_deleted(self, job_id):
+        with self._lock, self._connect() as conn:
+            conn.execute("UPDATE jobs SET source_deleted = 1, updated = ? WHERE id = ?", (time.time(), job_id))
+
+    def unfinished(self, max_attempts=0):
+        """Задания, которые нужно (до)обработать: прерванные и упавшие, у которых остались попытки."""
+        with self._connect() as conn:
+            placeholders = ", ".join("?" for _ in UNFINISHED_STATES)
+            rows = conn.execute(f"""SELECT * FROM jobs WHERE state IN ({placeholders})
+                                    OR (state = ? AND (? <= 0 OR attempts < ?)) ORDER BY id""",
+                                (*UNFINISHED_STATES, FAILED, max_attempts, max_attempts)).fetchall()
+        return [dict(row) for row in rows]
+
+    def counts(self):
+        """Число заданий в каждом состоянии."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return {state: count for state, count in rows}
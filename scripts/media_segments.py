@@ -0,0 +1,113 @@
+import re
+import subprocess
+from collections import Counter
+
+SILENCE_START_RE = re.compile(r'silence_start:\s*(-?[\d.]+)')
+SILENCE_END_RE = re.compile(r'silence_end:\s*(-?[\d.]+)')
+# Слова из соседних сегментов считаются одним словом, если их начала различаются меньше чем на это значение
+WORD_MATCH_TOLERANCE = 0.3
+
+def probe_duration(path):
+    """Длительность медиафайла в секундах по данным ffprobe."""
+    result = subprocess.run(["ffprobe", "-v", "error", "-show_entries", "format=duration",
+                             "-of", "default=noprint_wrappers=1:nokey=1", path],
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.strip())
+
+def detect_silences(path, noise_db=-35, min_silence=0.5):
+    """Находит паузы фильтром ffmpeg silencedetect. Возвращает список (начало, конец) в секундах."""
+    result = subprocess.run(["ffmpeg", "-hide_banner", "-nostdin", "-vn", "-i", path,
+                             "-af", f"silencedetect=noise={noise_db}dB:d={min_silence}", "-f", "null", "-"],
+                            capture_output=True, text=True, check=True)
+    silences = []
+    start = None
+    for line in result.stderr.splitlines():
+        match = SILENCE_START_RE.search(line)
+        if match:
+            start = max(0.0, float(match.group(1)))
+            continue
+        match = SILENCE_END_RE.search(line)
+        if match and start is not None:
+            silences.append((start, float(match.group(1))))
+            start = None
+    return silences
+
+def plan_segments(duration, silences, segment_seconds, search_window):
+    """Делит запись на сегменты примерно по segment_seconds, разрезая в середине ближайшей паузы.
+
+    Если в пределах search_window от целевой точки пауз нет, разрез делается ровно в целевой точке.
+    Возвращает список (начало, конец) в секундах.
+    """
+    cuts = []
+    previous = 0.0
+    target = segment_seconds
+    while duration - previous > segment_seconds * 1.25:
+        candidates = [(s + e) / 2 for s, e in silences
+                      if abs((s + e) / 2 - target) <= search_window and (s + e) / 2 > previous + segment_seconds / 2]
+        cut = min(candidates, key=lambda point: abs(point - target)) if candidates else target
+        cuts.append(cut)
+        previous = cut
+        target = cut + segment_seconds
+    bounds = [0.0] + cuts + [duration]
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+
+def _map_speakers(previous_words, words, cut, overlap_seconds, speaker_map, next_speaker):
+    """Сопоставляет метки спикеров нового сегмента с глобальными по словам в зоне перекрытия."""
+    votes = Counter()
+    overlap_previous = [w for w in previous_words if w['start'] >= cut - overlap_seconds]
+    for word in words:
+        if word['start'] >= cut:
+            break
+        match = min(overlap_previous, key=lambda w: abs(w['start'] - word['start']), default=None)
+        if match is not None and abs(match['start'] - word['start']) <= WORD_MATCH_TOLERANCE \
+                and word.get('speaker') is not None and match.get('speaker') is not None:
+            votes[(word['speaker'], match['speaker'])] += 1
+    mapping = {}
+    used = set()
+    for (local, global_speaker), _ in votes.most_common():
+        if local not in mapping and global_speaker not in used:
+            mapping[local] = global_speaker
+            used.add(global_speaker)
+    for word in words:
+        local = word.get('speaker')
+        if word['start'] >= cut and local is not None and local not in mapping:
+            mapping[local] = next_speaker
+            next_speaker += 1
+    speaker_map.update(mapping)
+    return next_speaker
+
+def stitch_segments(segments, overlap_seconds):
+    """Склеивает ответы Deepgram по сегментам в один ответ того же формата.
+
+    segments — список (начало сегмента с учетом перекрытия, граница разреза, ответ Deepgram).
+    Тайм-коды слов сдвигаются на начало сегмента; слова из зоны перекрытия (до границы разреза)
+    используются только для сопоставления спикеров и отбрасываются. overlap_seconds — длина зоны перекрытия.
+    """
+    stitched = []
+    next_speaker = 0
+    for index, (offset, cut, data) in enumerate(segments):
+        alternatives = (data.get('results', {}).get('channels') or [{}])[0].get('alternatives') or [{}]
+        words = []
+        for word in alternatives[0].get('words', []):
+            shifted = dict(word)
+            shifted['start'] = word['start'] + offset
+            shifted['end'] = word.get('end', word['start']) + offset
+            words.append(shifted)
+        speaker_map = {}
+        if index == 0:
+            for word in words:
+                if word.get('speaker') is not None and word['speaker'] not in speaker_map:
+                    speaker_map[word['speaker']] = next_speaker
+                    next_speaker += 1
+        else:
+            next_speaker = _map_speakers(stitched, words, cut, overlap_seconds, speaker_map, next_speaker)
+            words = [word for word in words if word['start'] >= cut]
+        for word in words:
+            if word.get('speaker') is not None:
+                word['speaker'] = speaker_map[word['speaker']]
+        stitched.extend(words)
+    transcript = " ".join(w.get('punctuated_word') or w['word'] for w in stitched)
+    return {
+        'metadata': {'segmented': True, 'segments': len(segments)},
+        'results': {'channels': [{'alternatives': [{'transcript': transcript, 'words': stitched}]}]},
+    }
@@ -0,0 +1,222 @@
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_current_job = contextvars.ContextVar('metrics_job', default=None)
+_jsonl_path = None
+_jsonl_lock = threading.Lock()
+
+class JobMetrics:
+    """Метрики одного задания: длительности этапов, счетчики (байты, токены, повторы) и результаты кэшей."""
+
+    def __init__(self, input_path, component, **fields):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.input_path = input_path
+        self.component = component
+        self.fields = dict(fields)
+        self.stages = {}
+        self.counters = {}
+        self.caches = {}
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add_stage(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add(self, name, value):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record(self, status, error=None):
+        return {
+            'ts': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            'job_id': self.job_id,
+            'component': self.component,
+            'input': self.input_path,
+            'status': status,
+            'error': error,
+            'duration_seconds': round(time.monotonic() - self.started, 3),
+            **self.fields,
+            'stages': {name: round(seconds, 3) for name, seconds in self.stages.items()},
+            'counters': self.counters,
+            'caches': self.caches,
+        }
+
+class Registry:
+    """Накопительные счетчики процесса для текстового эндпоинта в формате Prometheus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        # Имя ряда -> (семейство, тип): ряды _sum/_count сводки выводятся под одним заголовком # TYPE <семейство> summary
+        self._families = {}
+        self._gauges = {}
+
+    def _add(self, name, family, metric_type, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        self._families[name] = (family, metric_type)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self._add(name, name, 'counter', value, labels)
+
+    def observe(self, name, value, **labels):
+        """Добавляет наблюдение в сводку name (например, длительность задания): растут name_sum и name_count."""
+        with self._lock:
+            self._add(f"{name}_sum", name, 'summary', value, labels)
+            self._add(f"{name}_count", name, 'summary', 1, labels)
+
+    def register_gauge(self, name, callback, help_text=""):
+        """Регистрирует показатель, значение которого вычисляется при каждом запросе (например, глубина очереди)."""
+        with self._lock:
+            self._gauges[name] = (callback, help_text)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            families = dict(self._families)
+            # Ряды одного семейства должны идти подряд после его заголовка
+            counters = sorted(self._counters.items(), key=lambda item: (families[item[0][0]][0], item[0]))
+            gauges = list(self._gauges.items())
+        declared = set()
+        for (name, labels), value in counters:
+            value = round(value, 6) if isinstance(value, float) else value
+            family, metric_type = families[name]
+            if family not in declared:
+                lines.append(f"# TYPE {family} {metric_type}")
+                declared.add(family)
+            label_text = ",".join(f'{key}="{val}"' for key, val in labels)
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        for name, (callback, help_text) in gauges:
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            try:
+                lines.append(f"{name} {callback()}")
+            except Exception as e:
+                logging.warning(f"Не удалось вычислить показатель {name}: {e}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+def configure(jsonl_path):
+    """Задает файл JSONL для записей о заданиях (None — не писать)."""
+    global _jsonl_path
+    _jsonl_path = jsonl_path
+
+def current_job():
+    return _current_job.get()
+
+def bind(fn, job=None):
+    """Переносит задание (по умолчанию текущее) в функцию, которая будет выполнена в другом потоке."""
+    job = job or current_job()
+    def bound(*args, **kwargs):
+        token = _current_job.set(job)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current_job.reset(token)
+    return bound
+
+@contextmanager
+def job(input_path, component, **fields):
+    """Открывает задание и по завершении пишет его запись в JSONL. Вложенный вызов использует уже открытое задание."""
+    existing = current_job()
+    if existing is not None:
+        existing.fields.update(fields)
+        yield existing
+        return
+    job_metrics = JobMetrics(input_path, component, **fields)
+    token = _current_job.set(job_metrics)
+    status, error = 'ok', None
+    try:
+        yield job_metrics
+    except BaseException as e:
+        status, error = 'failed', repr(e)
+        raise
+    finally:
+        _current_job.reset(token)
+        finish(job_metrics, status, error)
+
+def finish(job_metrics, status, error=None):
+    """Завершает задание, созданное напрямую (JobMetrics), когда его этапы идут в разных потоках."""
+    record = job_metrics.record(status, error)
+    registry.inc('oaa_jobs_total', status=status)
+    registry.observe('oaa_job_seconds', record['duration_seconds'])
+    if 'queue_wait_seconds' in record:
+        registry.observe('oaa_queue_wait_seconds', record['queue_wait_seconds'])
+    for name, seconds in job_metrics.stages.items():
+        registry.observe('oaa_stage_seconds', seconds, stage=name)
+    for name, value in job_metrics.counters.items():
+        registry.inc(f'oaa_{name}_total', value)
+    for cache_name, result in job_metrics.caches.items():
+        registry.inc('oaa_cache_requests_total', cache=cache_name, result=result)
+    if _jsonl_path:
+        try:
+            with _jsonl_lock, open(_jsonl_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logging.warning(f"Не удалось записать метрики в {_jsonl_path}: {e}")
+
+@contextmanager
+def stage(name):
+    """Замеряет длительность этапа текущего задания (без задания — ничего не делает)."""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        job_metrics = current_job()
+        if job_metrics is not None:
+            job_metrics.add_stage(name, time.monotonic() - started)
+
+def add_stage(name, seconds):
+    job_metrics = current_job()
+    if job_metrics is not None:
+        job_metrics.add_stage(name, seconds)
+
+def add(name, value=1):
+    """Увеличивает счетчик текущего задания (bytes_sent, prompt_tokens, http_retries и т. п.)."""
+    job_metrics = current_job()
+    if job_metrics is not None:
+        job_metrics.add(name, value)
+    else:
+        registry.inc(f'oaa_{name}_total', value)
+
+def cache_result(cache_name, hit):
+    job_metrics = current_job()
+    result = 'hit' if hit else 'miss'
+    if job_metrics is not None:
+        job_metrics.caches[cache_name] = result
+    else:
+        registry.inc('oaa_cache_requests_total', cache=cache_name, result=result)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip('/') != '/metrics':
+            self.send_error(404)
+            return
+        body = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_http_server(host, port):
+    """Запускает эндпоинт /metrics в фоновом потоке."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logging.info(f"Метрики доступны по адресу http://{host}:{server.server_port}/metrics")
+    return server
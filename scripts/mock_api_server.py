@@ -0,0 +1,208 @@
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("и вот что говорит нам этот стих давайте посмотрим на пример из жизни пастуха который искал "
+         "потерянную овцу в горах Иисус использовал такие наглядные пособия чтобы слушатели поняли").split()
+
+def build_deepgram_response(word_count, speakers=2):
+    """Ответ реалистичного размера: слова с тайм-кодами, уверенностью и спикерами."""
+    words = []
+    position = 0.0
+    speaker = 0
+    for index in range(word_count):
+        word = WORDS[index % len(WORDS)]
+        if index % 40 == 39:
+            speaker = (speaker + 1) % speakers
+            position += 1.2
+        duration = 0.15 + len(word) * 0.04
+        words.append({
+            'word': word,
+            'start': round(position, 3),
+            'end': round(position + duration, 3),
+            'confidence': round(random.uniform(0.8, 1.0), 4),
+            'speaker': speaker,
+            'speaker_confidence': round(random.uniform(0.5, 1.0), 4),
+            'punctuated_word': word.capitalize() + '.' if index % 12 == 11 else word,
+        })
+        position += duration + 0.12
+    transcript = " ".join(w['punctuated_word'] for w in words)
+    return {
+        'metadata': {'request_id': 'mock', 'duration': round(position, 3), 'channels': 1},
+        'results': {'channels': [{'alternatives': [{'transcript': transcript, 'confidence': 0.95, 'words': words}]}]},
+    }
+
+def build_note(example_count):
+    lines = ["---", "title: Пример анализа лекции", "tags: [jw, research, transcript, mock]", "---", "",
+             "## Анализ: Ключевые Примеры (Наглядные Пособия)", ""]
+    for index in range(example_count):
+        lines += [f"> [!example|collapse open] [Пример {index + 1}, 00:{index:02d}:00] #НаглядноеПособие",
+                  "> " + " ".join(WORDS[:25]), ""]
+    lines.append("## Полный Транскрипт")
+    return "\n".join(lines)
+
+def build_map_result(example_count):
+    return json.dumps({'title': 'Фрагмент лекции', 'examples': [
+        {'title': f'Пример {index + 1}', 'timecode': f'00:{index:02d}:00', 'summary': " ".join(WORDS[:20]),
+         'tags': ['#НаглядноеПособие']} for index in range(example_count)]}, ensure_ascii=False)
+
+class MockState:
+    def __init__(self, args):
+        self.args = args
+        self.lock = threading.Lock()
+        self.stats = {'deepgram_requests': 0, 'nvidia_requests': 0, 'errors_injected': 0,
+                      'deepgram_bytes_received': 0, 'nvidia_bytes_received': 0, 'bytes_received': 0, 'bytes_sent': 0}
+        self.deepgram_body = json.dumps(build_deepgram_response(args.deepgram_words), ensure_ascii=False).encode('utf-8')
+
+    def count(self, **increments):
+        with self.lock:
+            for key, value in increments.items():
+                self.stats[key] += value
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        # Клиент может закрыть keep-alive соединение в любой момент (например, при переполнении своего пула)
+        try:
+            super().handle()
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+
+    def _read_body(self):
+        """Читает тело запроса (Content-Length или chunked), имитируя ограниченную пропускную способность."""
+        args = self.state.args
+        started = time.monotonic()
+        received = 0
+        chunks = []
+        def consume(size):
+            nonlocal received
+            data = self.rfile.read(size)
+            received += len(data)
+            chunks.append(data)
+            if args.upload_mbps > 0:
+                expected = received * 8 / (args.upload_mbps * 1_000_000)
+                delay = expected - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            while True:
+                size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                consume(size)
+                self.rfile.readline()
+        else:
+            remaining = int(self.headers.get('Content-Length', 0))
+            while remaining > 0:
+                size = min(remaining, 256 * 1024)
+                consume(size)
+                remaining -= size
+        endpoint = 'deepgram_bytes_received' if self.path.startswith('/v1/listen') else 'nvidia_bytes_received'
+        self.state.count(bytes_received=received, **{endpoint: received})
+        return b"".join(chunks)
+
+    def _send(self, status, body=b"", content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.state.count(bytes_sent=len(body))
+
+    def do_GET(self):
+        if self.path.startswith('/stats'):
+            with self.state.lock:
+                stats = json.dumps(self.state.stats).encode('utf-8')
+            self._send(200, stats)
+        else:
+            self._send(404)
+
+    def do_POST(self):
+        args = self.state.args
+        body = self._read_body()
+        if random.random() < args.error_rate:
+            self.state.count(errors_injected=1)
+            self._send(random.choice([429, 503]), b'{"error": "injected"}', headers={'Retry-After': str(args.retry_after)})
+            return
+        if self.path.startswith('/v1/listen'):
+            self.state.count(deepgram_requests=1)
+            time.sleep(args.deepgram_latency)
+            self._send(200, self.state.deepgram_body)
+        elif self.path.startswith('/v1/chat/completions'):
+            self.state.count(nvidia_requests=1)
+            self._chat(json.loads(body or b'{}'))
+        else:
+            self._send(404)
+
+    def _chat(self, request):
+        args = self.state.args
+        prompt = (request.get('messages') or [{}])[0].get('content', '')
+        content = build_map_result(3) if 'ТОЛЬКО JSON' in prompt else build_note(args.examples)
+        pieces = [content[i:i + 4] for i in range(0, len(content), 4)]
+        usage = {'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(pieces),
+                 'total_tokens': len(prompt) // 4 + len(pieces)}
+        time.sleep(args.llm_ttft)
+        token_delay = 1.0 / args.llm_tokens_per_second if args.llm_tokens_per_second > 0 else 0
+        if not request.get('stream'):
+            time.sleep(token_delay * len(pieces))
+            self._send(200, json.dumps({'choices': [{'message': {'role': 'assistant', 'content': content}}],
+                                        'usage': usage}, ensure_ascii=False).encode('utf-8'))
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        def write_event(event):
+            data = b"data: " + json.dumps(event, ensure_ascii=False).encode('utf-8') + b"\n\n"
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+            self.state.count(bytes_sent=len(data))
+        for piece in pieces:
+            write_event({'choices': [{'delta': {'content': piece}}]})
+            if token_delay:
+                time.sleep(token_delay)
+        write_event({'choices': [], 'usage': usage})
+        final = b"data: [DONE]\n\n"
+        self.wfile.write(f"{len(final):x}\r\n".encode() + final + b"\r\n0\r\n\r\n")
+        self.wfile.flush()
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Локальные заглушки Deepgram (/v1/listen) и NVIDIA API "
+                                                 "(/v1/chat/completions) для бенчмарков. Статистика: GET /stats.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--deepgram-latency", type=float, default=1.0, help="время распознавания, с")
+    parser.add_argument("--deepgram-words", type=int, default=6000, help="число слов в ответе Deepgram")
+    parser.add_argument("--upload-mbps", type=float, default=100.0, help="пропускная способность приема, Мбит/с (0 — без ограничения)")
+    parser.add_argument("--llm-ttft", type=float, default=0.5, help="время до первого токена, с")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--examples", type=int, default=5, help="число примеров в заметке")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 429/503")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    MockHandler.state = MockState(args)
+    server = ThreadingHTTPServer((args.host, args.port), MockHandler)
+    server.daemon_threads = True
+    print(f"Заглушки API слушают http://{args.host}:{server.server_port}", file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
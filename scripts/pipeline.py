@@ -0,0 +1,111 @@
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+_STOP = object()
+
+class Stage:
+    """Этап конвейера: блокирующий обработчик элемента, число параллельных исполнителей и размер входной очереди.
+
+    Обработчик вызывается как handler(item, queue_wait), где queue_wait — время ожидания элемента
+    во входной очереди этапа в секундах, и возвращает элемент для следующего этапа или None,
+    если элемент дальше не идет (пропущен).
+    """
+
+    def __init__(self, name, handler, workers=1, queue_size=0):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.processed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+
+class Pipeline:
+    """Конвейер asyncio из этапов, связанных ограниченными очередями.
+
+    Обработчики этапов выполняются в пуле потоков, поэтому разные файлы одновременно находятся
+    на разных этапах (следующий загружается в Deepgram, пока предыдущий анализирует LLM).
+    Заполненная очередь приостанавливает предыдущий этап, и число элементов в работе остается ограниченным.
+    """
+
+    def __init__(self, stages, on_error=None, on_done=None):
+        self.stages = stages
+        self.on_error = on_error
+        self.on_done = on_done
+        self.completed = 0
+        self.failed = 0
+
+    def run(self, items):
+        """Пропускает items через все этапы и возвращает число элементов, завершившихся ошибкой."""
+        return asyncio.run(self._run(items))
+
+    async def _run(self, items):
+        started = time.monotonic()
+        queues = [asyncio.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        executor = ThreadPoolExecutor(max_workers=sum(stage.workers for stage in self.stages),
+                                      thread_name_prefix="pipeline")
+        try:
+            stage_tasks = []
+            for index, stage in enumerate(self.stages):
+                workers = [asyncio.create_task(self._worker(index, queues, executor)) for _ in range(stage.workers)]
+                stage_tasks.append(workers)
+            for item in items:
+                await queues[0].put((item, time.monotonic()))
+            # Этапы останавливаются по очереди: следующий получает сигнал, когда все исполнители предыдущего закончили
+            for index, workers in enumerate(stage_tasks):
+                for _ in workers:
+                    await queues[index].put((_STOP, None))
+                await asyncio.gather(*workers)
+        except BaseException:
+            # Ctrl+C (отмена задачи) или ошибка: поставленные в пул обработчики отменяются, а не дожидаются
+            # выполнения (загрузки в Deepgram, запросы к LLM); уже запущенные потоки завершатся сами
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown(wait=True)
+        elapsed = time.monotonic() - started
+        for stage in self.stages:
+            handled = stage.processed + stage.failed + stage.skipped
+            average_wait = stage.wait_seconds / handled if handled else 0.0
+            utilization = stage.busy_seconds / (elapsed * stage.workers) if elapsed > 0 else 0.0
+            logging.info(f"Этап {stage.name}: обработано {stage.processed}, пропущено {stage.skipped}, с ошибкой {stage.failed}, "
+                         f"среднее ожидание в очереди {average_wait:.1f} с, загрузка исполнителей {utilization:.0%}")
+        logging.info(f"Конвейер завершен за {elapsed:.1f} с: выполнено {self.completed}, с ошибкой {self.failed}")
+        return self.failed
+
+    async def _worker(self, index, queues, executor):
+        stage = self.stages[index]
+        loop = asyncio.get_running_loop()
+        is_last = index == len(self.stages) - 1
+        while True:
+            item, enqueued_at = await queues[index].get()
+            if item is _STOP:
+                return
+            queue_wait = time.monotonic() - enqueued_at
+            stage.wait_seconds += queue_wait
+            started = time.monotonic()
+            try:
+                result = await loop.run_in_executor(executor, stage.handler, item, queue_wait)
+            except (Exception, SystemExit) as e:
+                # sys.exit() внутри обработчика завершает только этот элемент, а не конвейер
+                stage.failed += 1
+                self.failed += 1
+                logging.error(f"Этап {stage.name}: ошибка при обработке {item}: {e!r}")
+                if self.on_error is not None:
+                    self.on_error(item, stage.name, e)
+                continue
+            finally:
+                stage.busy_seconds += time.monotonic() - started
+            if result is None:
+                stage.skipped += 1
+                continue
+            stage.processed += 1
+            if is_last:
+                self.completed += 1
+                if self.on_done is not None:
+                    self.on_done(result)
+            else:
+                await queues[index + 1].put((result, time.monotonic()))
@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+
+HASH_CHUNK_SIZE = 1024 * 1024
+INDEX_FILENAME = "index.sqlite"
+# Дополнительные файлы записи (например, колоночное хранилище слов) учитываются в ее размере и удаляются вместе с ней
+SIDECAR_SUFFIXES = (".words",)
+
+def atomic_write_bytes(path, payload):
+    """Атомарно записывает файл: временный файл в той же папке, fsync и os.replace."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(payload)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def hash_file(path):
+    """Считает BLAKE2b-хэш содержимого файла, читая его блоками по 1 МБ."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def make_cache_key(content_hash, params):
+    """Строит ключ кэша из хэша содержимого и параметров распознавания (модель, язык, диаризация...)."""
+    canonical_params = json.dumps(params, sort_keys=True, separators=(',', ':'))
+    return hashlib.blake2b(f"{content_hash}|{canonical_params}".encode('utf-8'), digest_size=20).hexdigest()
+
+class TranscriptCache:
+    """Кэш JSON-записей (ответы Deepgram, результаты анализа LLM), адресуемый по содержимому,
+    с индексом SQLite, LRU-вытеснением по размеру и необязательным сроком жизни записей."""
+
+    def __init__(self, cache_dir, max_bytes, ttl_seconds=0, name="Кэш транскриптов"):
+        self.cache_dir = cache_dir
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.index_path = os.path.join(cache_dir, INDEX_FILENAME)
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+                                key TEXT PRIMARY KEY,
+                                path TEXT NOT NULL,
+                                size INTEGER NOT NULL,
+                                source_name TEXT,
+                                created REAL NOT NULL,
+                                last_access REAL NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+            conn.execute("""CREATE TABLE IF NOT EXISTS file_hashes (
+                                path TEXT PRIMARY KEY,
+                                size INTEGER NOT NULL,
+                                mtime_ns INTEGER NOT NULL,
+                                content_hash TEXT NOT NULL)""")
+
+    def _connect(self):
+        return sqlite3.connect(self.index_path, timeout=30)
+
+    def entry_path(self, key, suffix=".json"):
+        """Путь к записи в шардированной раскладке: <ab>/<cd>/<key><suffix>."""
+        return os.path.join(self.cache_dir, key[:2], key[2:4], f"{key}{suffix}")
+
+    def content_hash(self, path):
+        """Возвращает хэш содержимого файла, используя запомненное значение, если размер и mtime не изменились."""
+        stat = os.stat(path)
+        abs_path = os.path.abspath(path)
+        with self._connect() as conn:
+            row = conn.execute("SELECT size, mtime_ns, content_hash FROM file_hashes WHERE path = ?",
+                               (abs_path,)).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+        started = time.monotonic()
+        content_hash = hash_file(path)
+        logging.info(f"Хэш содержимого {os.path.basename(path)} вычислен за {time.monotonic() - started:.2f} с")
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, content_hash) VALUES (?, ?, ?, ?)",
+                         (abs_path, stat.st_size, stat.st_mtime_ns, content_hash))
+        return content_hash
+
+    def get(self, key):
+        """Возвращает закэшированную запись или None. Поврежденные и устаревшие записи удаляются."""
+        path = self.entry_path(key)
+        with self._lock:
+            if self._expired(key):
+                return None
+            if not os.path.exists(path):
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.error(f"{self.name}: запись {path} повреждена: {e}. Удаляем ее.")
+                self._remove_entry(key)
+                return None
+            with self._connect() as conn:
+                updated = conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key)).rowcount
+                if not updated:
+                    # Файл записан, но индекс не успел обновиться (например, сбой после os.replace)
+                    self._index_entry(conn, key, None)
+            return data
+
+    def _expired(self, key):
+        """Удаляет запись старше ttl_seconds и возвращает True, если она устарела."""
+        if not self.ttl_seconds or self.ttl_seconds <= 0:
+            return False
+        with self._connect() as conn:
+            row = conn.execute("SELECT created FROM entries WHERE key = ?", (key,)).fetchone()
+        if row and time.time() - row[0] > self.ttl_seconds:
+            logging.info(f"{self.name}: запись {key} устарела (старше {self.ttl_seconds:.0f} с). Удаляем ее.")
+            self._remove_entry(key)
+            return True
+        return False
+
+    def get_sidecar_path(self, key, suffix):
+        """Путь к дополнительному файлу записи (suffix из SIDECAR_SUFFIXES), если он есть; обновляет время доступа."""
+        path = self.entry_path(key, suffix)
+        with self._lock:
+            if self._expired(key) or not os.path.exists(path):
+                return None
+            with self._connect() as conn:
+                conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            return path
+
+    def put_sidecar(self, key, suffix, payload):
+        """Атомарно сохраняет дополнительный файл рядом с JSON-записью key (сама запись должна существовать)."""
+        with self._lock:
+            if not os.path.exists(self.entry_path(key)):
+                return
+            atomic_write_bytes(self.entry_path(key, suffix), payload)
+            with self._connect() as conn:
+                self._index_entry(conn, key, None, keep_created=True)
+            self._evict()
+
+    def remove_sidecar(self, key, suffix):
+        path = self.entry_path(key, suffix)
+        with self._lock:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def put(self, key, data, source_name=None):
+        """Атомарно сохраняет запись в компактном JSON и вытесняет старые записи при превышении лимита."""
+        payload = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        with self._lock:
+            atomic_write_bytes(self.entry_path(key), payload)
+            # Дополнительные файлы строились из прежнего содержимого записи
+            for suffix in SIDECAR_SUFFIXES:
+                if os.path.exists(self.entry_path(key, suffix)):
+                    os.remove(self.entry_path(key, suffix))
+            with self._connect() as conn:
+                self._index_entry(conn, key, source_name)
+            self._evict()
+
+    def _index_entry(self, conn, key, source_name, keep_created=False):
+        now = time.time()
+        paths = [self.entry_path(key)] + [self.entry_path(key, suffix) for suffix in SIDECAR_SUFFIXES]
+        size = sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+        created = "entries.created" if keep_created else "excluded.created"
+        conn.execute(f"""INSERT INTO entries (key, path, size, source_name, created, last_access) VALUES (?, ?, ?, ?, ?, ?)
+                         ON CONFLICT(key) DO UPDATE SET size = excluded.size, created = {created}, last_access = excluded.last_access,
+                                                        source_name = COALESCE(excluded.source_name, entries.source_name)""",
+                     (key, os.path.relpath(self.entry_path(key), self.cache_dir), size, source_name, now, now))
+
+    def _remove_entry(self, key):
+        for path in [self.entry_path(key)] + [self.entry_path(key, suffix) for suffix in SIDECAR_SUFFIXES]:
+            if os.path.exists(path):
+                os.remove(path)
+        with self._connect() as conn:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def total_size(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _evict(self):
+        if not self.max_bytes or self.max_bytes <= 0:
+            return
+        total = self.total_size()
+        if total <= self.max_bytes:
+            return
+        with self._connect() as conn:
+            candidates = conn.execute("SELECT key, size, source_name FROM entries ORDER BY last_access ASC").fetchall()
+        for key, size, source_name in candidates:
+            if total <= self.max_bytes:
+                break
+            self._remove_entry(key)
+            total -= size
+            logging.info(f"{self.name}: вытеснена запись {key} ({source_name or 'без имени'}, {size} байт)")
@@ -0,0 +1,147 @@
+import re
+
+SENTENCE_END_RE = re.compile(r'[.!?…]["»)]*$')
+TIMECODE_WIDTH = len("[00:00:00] ")
+# Грубая оценка для русского текста; точное число токенов зависит от токенизатора модели
+APPROX_CHARS_PER_TOKEN = 3.5
+
+def estimate_tokens(num_chars):
+    """Приблизительное число токенов для текста заданной длины."""
+    return int(num_chars / APPROX_CHARS_PER_TOKEN)
+
+def format_timecode(seconds):
+    """Переводит секунды в тайм-код HH:MM:SS."""
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{(seconds % 3600) // 60:02d}:{seconds % 60:02d}"
+
+def iter_words(data):
+    """Один проход по ответу Deepgram: слова первой альтернативы каждого канала."""
+    channels = data.get('results', {}).get('channels') or []
+    for channel in channels:
+        alternatives = channel.get('alternatives') or []
+        if not alternatives:
+            continue
+        for word_info in alternatives[0].get('words', []):
+            yield {
+                'word': (word_info.get('punctuated_word') or word_info['word']).strip(),
+                'start': word_info['start'],
+                'end': word_info.get('end', word_info['start']),
+                'speaker': word_info.get('speaker'),
+                'confidence': word_info.get('confidence'),
+            }
+
+def word_level_length_from_columns(vocab, word_ids):
+    """Длина транскрипта в формате "тайм-код перед каждым словом" без его построения. Слово i — vocab[word_ids[i]]."""
+    if not len(word_ids):
+        return 0
+    return sum(TIMECODE_WIDTH + len(vocab[word_id]) for word_id in word_ids) + len(word_ids) - 1
+
+def build_segments_from_columns(vocab, word_ids, starts, ends, speakers, max_chars=400, pause_seconds=1.5, scale=1):
+    """Группирует слова в сегменты: новый сегмент при смене спикера, паузе или после конца
+    предложения, если сегмент уже длиннее половины max_chars.
+
+    Слова заданы колонками (списки, array или memoryview из WordStore): слово i — vocab[word_ids[i]];
+    времена в единицах 1/scale секунды; спикер None или < 0 — неизвестен.
+    """
+    segments = []
+    current = None
+    current_speaker = None
+    previous_end = None
+    pause_units = pause_seconds * scale
+    for index, word_id in enumerate(word_ids):
+        text = vocab[word_id]
+        start = starts[index]
+        speaker = speakers[index]
+        if current is not None:
+            boundary = (
+                speaker != current_speaker
+                or start - previous_end >= pause_units
+                or current['chars'] + len(text) + 1 > max_chars
+                or (current['chars'] >= max_chars // 2 and SENTENCE_END_RE.search(current['words'][-1]))
+            )
+            if boundary:
+                segments.append(current)
+                current = None
+        if current is None:
+            current_speaker = speaker
+            current = {'start': start / scale, 'end': ends[index] / scale,
+                       'speaker': speaker if speaker is not None and speaker >= 0 else None, 'words': [], 'chars': -1}
+        current['words'].append(text)
+        current['chars'] += len(text) + 1
+        previous_end = ends[index]
+        current['end'] = previous_end / scale
+    if current is not None:
+        segments.append(current)
+    return segments
+
+def format_segments(segments, speaker_labels=True):
+    """Форматирует сегменты по одному на строку: "[HH:MM:SS] Спикер N: текст"."""
+    lines = []
+    for segment in segments:
+        text = " ".join(segment['words'])
+        if speaker_labels and segment['speaker'] is not None:
+            text = f"Спикер {segment['speaker'] + 1}: {text}"
+        lines.append(f"[{format_timecode(segment['start'])}] {text}")
+    return "\n".join(lines)
+
+def format_words_from_columns(vocab, word_ids, starts, scale=1):
+    """Старый формат: тайм-код перед каждым словом."""
+    return " ".join(f"[{format_timecode(starts[index] / scale)}] {vocab[word_id]}" for index, word_id in enumerate(word_ids))
+
+_SEGMENT_SPLIT_RE = re.compile(r'\s*(?=\[\d{2}:\d{2}:\d{2}\])')
+
+def parse_timecode(timecode):
+    """Переводит тайм-код HH:MM:SS (в том числе в квадратных скобках) в секунды. Возвращает None, если формат неверный."""
+    match = re.search(r'(\d{1,2}):(\d{2}):(\d{2})', timecode or '')
+    if not match:
+        return None
+    hours, minutes, seconds = (int(part) for part in match.groups())
+    return hours * 3600 + minutes * 60 + seconds
+
+def _split_units(transcript, max_chars):
+    """Делит транскрипт на неделимые единицы: по тайм-кодам, иначе по строкам; слишком длинные — по словам."""
+    units = [unit for unit in _SEGMENT_SPLIT_RE.split(transcript) if unit.strip()]
+    if len(units) <= 1:
+        units = [line for line in transcript.split('\n') if line.strip()]
+    result = []
+    for unit in units:
+        if len(unit) <= max_chars:
+            result.append(unit.strip())
+            continue
+        piece = []
+        piece_chars = 0
+        for word in unit.split():
+            if piece and piece_chars + len(word) + 1 > max_chars:
+                result.append(" ".join(piece))
+                piece, piece_chars = [], 0
+            piece.append(word)
+            piece_chars += len(word) + 1
+        if piece:
+            result.append(" ".join(piece))
+    return result
+
+def split_into_chunks(transcript, chunk_chars, overlap_chars):
+    """Делит транскрипт на перекрывающиеся окна по границам сегментов.
+
+    Каждое окно не длиннее chunk_chars; следующее окно начинается с последних сегментов
+    предыдущего общей длиной не более overlap_chars.
+    """
+    units = _split_units(transcript, chunk_chars)
+    chunks = []
+    start = 0
+    while start < len(units):
+        end = start
+        chars = 0
+        while end < len(units) and (end == start or chars + len(units[end]) + 1 <= chunk_chars):
+            chars += len(units[end]) + 1
+            end += 1
+        chunks.append("\n".join(units[start:end]))
+        if end >= len(units):
+            break
+        next_start = end
+        overlap = 0
+        while next_start - 1 > start and overlap + len(units[next_start - 1]) + 1 <= overlap_chars:
+            next_start -= 1
+            overlap += len(units[next_start]) + 1
+        start = next_start
+    return chunks
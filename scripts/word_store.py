@@ -0,0 +1,121 @@
+import sys
+import mmap
+import array
+import struct
+
+from transcript_segments import iter_words
+
+MAGIC = b"OAAW"
+VERSION = 1
+# magic, версия, флаги (зарезервировано), число слов, размер словаря, длина словаря в байтах
+HEADER = struct.Struct("<4sHHIII")
+# Времена хранятся в миллисекундах (uint32), уверенность — в десятитысячных (uint16)
+TIME_SCALE = 1000
+CONFIDENCE_SCALE = 10000
+NO_CONFIDENCE = 0xFFFF
+NO_SPEAKER = -1
+
+class WordStore:
+    """Компактное колоночное хранилище слов транскрипта.
+
+    Колонки start/end (мс), индекс слова, уверенность и спикер лежат массивами фиксированной ширины,
+    тексты слов — в словаре уникальных слов. Файл открывается через mmap, и колонки читаются
+    без разбора JSON и без словаря Python на каждое слово.
+    """
+
+    def __init__(self, vocab, word_ids, starts, ends, confidences, speakers, _mapping=None):
+        self.vocab = vocab
+        self.word_ids = word_ids
+        self.starts = starts
+        self.ends = ends
+        self.confidences = confidences
+        self.speakers = speakers
+        self._mapping = _mapping
+
+    def __len__(self):
+        return len(self.word_ids)
+
+    @classmethod
+    def from_deepgram(cls, data):
+        """Строит хранилище из ответа Deepgram (слова, которые отдает iter_words)."""
+        vocab = []
+        vocab_index = {}
+        word_ids = array.array('I')
+        starts = array.array('I')
+        ends = array.array('I')
+        confidences = array.array('H')
+        speakers = array.array('h')
+        for word in iter_words(data):
+            text = word['word']
+            word_id = vocab_index.get(text)
+            if word_id is None:
+                word_id = vocab_index[text] = len(vocab)
+                vocab.append(text)
+            word_ids.append(word_id)
+            starts.append(round(word['start'] * TIME_SCALE))
+            ends.append(round(word['end'] * TIME_SCALE))
+            confidence = word['confidence']
+            confidences.append(NO_CONFIDENCE if confidence is None else round(min(max(confidence, 0.0), 1.0) * CONFIDENCE_SCALE))
+            speakers.append(NO_SPEAKER if word['speaker'] is None else word['speaker'])
+        return cls(vocab, word_ids, starts, ends, confidences, speakers)
+
+    def to_bytes(self):
+        """Сериализует хранилище: заголовок, колонки uint32, смещения словаря, колонки uint16/int16 и тексты слов."""
+        encoded = [text.encode('utf-8') for text in self.vocab]
+        offsets = array.array('I', [0])
+        for item in encoded:
+            offsets.append(offsets[-1] + len(item))
+        blob = b"".join(encoded)
+        columns = [array.array('I', self.starts), array.array('I', self.ends), array.array('I', self.word_ids), offsets,
+                   array.array('H', self.confidences), array.array('h', self.speakers)]
+        if sys.byteorder != 'little':
+            for column in columns:
+                column.byteswap()
+        header = HEADER.pack(MAGIC, VERSION, 0, len(self.word_ids), len(self.vocab), len(blob))
+        return header + b"".join(column.tobytes() for column in columns) + blob
+
+    @classmethod
+    def load(cls, path):
+        """Открывает файл через mmap. Колонки — memoryview поверх отображенного файла (без копирования)."""
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls._from_buffer(mapping)
+        except Exception:
+            mapping.close()
+            raise
+
+    @classmethod
+    def _from_buffer(cls, buffer):
+        if len(buffer) < HEADER.size:
+            raise ValueError("файл хранилища слов обрезан")
+        magic, version, _, word_count, vocab_count, blob_size = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"неизвестный формат хранилища слов (magic {magic!r}, версия {version})")
+        expected = HEADER.size + word_count * (4 * 3 + 2 * 2) + (vocab_count + 1) * 4 + blob_size
+        if len(buffer) != expected:
+            raise ValueError(f"размер файла хранилища слов {len(buffer)} байт вместо {expected}")
+        view = memoryview(buffer)
+        position = HEADER.size
+        def column(code, count):
+            nonlocal position
+            size = count * struct.calcsize(code)
+            part = view[position:position + size]
+            position += size
+            if sys.byteorder != 'little':
+                copy = array.array(code, part.tobytes())
+                copy.byteswap()
+                return copy
+            return part.cast(code)
+        starts = column('I', word_count)
+        ends = column('I', word_count)
+        word_ids = column('I', word_count)
+        offsets = column('I', vocab_count + 1)
+        confidences = column('H', word_count)
+        speakers = column('h', word_count)
+        # Словарь уникальных слов невелик: декодируется целиком, тексты разделяются всеми вхождениями
+        blob = bytes(view[position:position + blob_size])
+        vocab = [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(vocab_count)]
+        if isinstance(offsets, memoryview):
+            offsets.release()
+        return cls(vocab, word_ids, starts, ends, confidences, speakers, _mapping=buffer)
@@ -0,0 +1,106 @@
+import time
+import queue
+import logging
+import threading
+
+import metrics
+
+_STOP = object()
+
+class WorkerPool:
+    """Ограниченный пул потоков с очередью заданий для обработки файлов внутри одного процесса."""
+
+    def __init__(self, handler, workers=2, max_queue=0, name="worker"):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.name = name
+        self._queue = queue.Queue(maxsize=max(0, max_queue))
+        self._threads = []
+        self._lock = threading.Lock()
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+        self._accepting = False
+
+    def start(self):
+        self._accepting = True
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{index + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logging.info(f"Пул обработки запущен: {self.workers} исполнителей, лимит очереди: {self._queue.maxsize or 'без ограничений'}")
+
+    def submit(self, item, block=True, timeout=None):
+        """Ставит задание в очередь. При заполненной очереди ждет (block=True) или возвращает False."""
+        if not self._accepting:
+            logging.warning(f"Пул останавливается, задание {item} не принято.")
+            return False
+        try:
+            self._queue.put((item, time.monotonic()), block=block, timeout=timeout)
+        except queue.Full:
+            logging.warning(f"Очередь заполнена ({self._queue.maxsize}), задание {item} не принято.")
+            return False
+        stats = self.stats()
+        logging.info(f"Задание {item} поставлено в очередь (в очереди: {stats['queued']}, активных: {stats['active']}/{stats['workers']})")
+        return True
+
+    def stats(self):
+        """Текущее состояние пула: глубина очереди, активные исполнители и счетчики заданий."""
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'active': self._active,
+                'workers': self.workers,
+                'completed': self._completed,
+                'failed': self._failed,
+            }
+
+    def shutdown(self, drain=True):
+        """Останавливает пул. При drain=True дожидается выполнения всех поставленных заданий."""
+        self._accepting = False
+        if not drain:
+            dropped = 0
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                self._queue.task_done()
+                dropped += 1
+            if dropped:
+                logging.warning(f"Отброшено заданий из очереди при остановке: {dropped}")
+        stats = self.stats()
+        logging.info(f"Остановка пула: ожидаем завершения {stats['active']} активных и {stats['queued']} поставленных заданий...")
+        for _ in self._threads:
+            self._queue.put((_STOP, None))
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        logging.info(f"Пул остановлен. Выполнено: {self._completed}, с ошибкой: {self._failed}")
+
+    def _run(self):
+        while True:
+            item, enqueued_at = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                with self._lock:
+                    self._active += 1
+                queue_wait = time.monotonic() - enqueued_at
+                logging.info(f"Начало обработки {item} (ожидание в очереди: {queue_wait:.1f} с)")
+                try:
+                    with metrics.job(str(item), f"pool:{self.name}", queue_wait_seconds=round(queue_wait, 3)):
+                        self.handler(item)
+                    succeeded = True
+                except BaseException as e:
+                    # sys.exit() внутри обработчика не должен останавливать исполнителя
+                    logging.error(f"Ошибка при обработке {item}: {e!r}")
+                    succeeded = False
+                with self._lock:
+                    self._active -= 1
+                    if succeeded:
+                        self._completed += 1
+                    else:
+                        self._failed += 1
+            finally:
+                self._queue.task_done()